@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from jad.types import JadConfig
 
 # Action head indices
@@ -12,19 +14,22 @@ OFFENSIVE_PRAYER_SIZE = 2   # no-op + rigour
 POTION_SIZE = 4             # none + 3 potions
 
 
+@lru_cache(maxsize=32)
 def get_target_head_size(config: JadConfig) -> int:
     """Get the size of the target head: 1 (no-op) + N (jads) + N*H (healers)."""
     return 1 + config.jad_count + config.jad_count * config.healers_per_jad
 
 
-def get_action_dims(config: JadConfig) -> list[int]:
+@lru_cache(maxsize=32)
+def get_action_dims(config: JadConfig) -> tuple[int, ...]:
     """
     Get dimensions for MultiDiscrete action space.
-    Returns [protection_prayer_size, offensive_prayer_size, potion_size, target_size].
+    Returns (protection_prayer_size, offensive_prayer_size, potion_size, target_size).
     """
-    return [
+    return (
         PROTECTION_PRAYER_SIZE,
         OFFENSIVE_PRAYER_SIZE,
         POTION_SIZE,
         get_target_head_size(config),
-    ]
+    )
+
@@ -1,6 +1,6 @@
 """Environment components for Jad training."""
 
-from jad.env.gym_env import JadGymEnv, make_jad_env
+from jad.env.gym_env import JadGymEnv, RewardFunc, make_jad_env
 from jad.env.observations import (
     get_observation_dim,
     get_continuous_feature_count,
@@ -8,10 +8,13 @@ from jad.env.observations import (
     obs_to_array,
 )
 from jad.env.vec_normalize import RunningNormalizer, SelectiveVecNormalize
-from jad.env.process_wrapper import EnvProcessWrapper
+from jad.env.process_wrapper import EnvProcessWrapper, JadBatchProcessWrapper, JadShardedProcessWrapper
+from jad.env.batched_env import BatchedJadVecEnv
+from jad.env.vec_env import VEC_ENV_TYPES, default_vec_env, make_vec_jad_env
 
 __all__ = [
     "JadGymEnv",
+    "RewardFunc",
     "make_jad_env",
     "get_observation_dim",
     "get_continuous_feature_count",
@@ -20,4 +23,10 @@ __all__ = [
     "RunningNormalizer",
     "SelectiveVecNormalize",
     "EnvProcessWrapper",
+    "JadBatchProcessWrapper",
+    "JadShardedProcessWrapper",
+    "BatchedJadVecEnv",
+    "VEC_ENV_TYPES",
+    "default_vec_env",
+    "make_vec_jad_env",
 ]
@@ -0,0 +1,152 @@
+from collections.abc import Sequence
+from typing import Any
+
+import gymnasium as gym
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices
+
+from jad.actions import get_action_dims
+from jad.env.gym_env import BASE_EPISODE_LENGTH, TRUNCATION_PENALTIES, RewardFunc
+from jad.env.observations import get_observation_dim
+from jad.env.process_wrapper import JadBatchProcessWrapper, JadShardedProcessWrapper
+from jad.types import JadConfig
+
+
+class BatchedJadVecEnv(VecEnv):
+    """
+    SB3 VecEnv running all environments inside one Node process.
+
+    Behaves like DummyVecEnv over Monitor-less JadGymEnvs: same spaces, rewards,
+    truncation and info keys, with automatic reset of finished envs (the final
+    observation is stored in info["terminal_observation"]). Wrap with VecMonitor
+    for episode statistics.
+
+    With n_workers > 1 the envs are split across that many Node processes, which
+    simulate their shares of the batch in parallel.
+    """
+
+    render_mode = None
+
+    # Attributes every env shares, returned once per index by get_attr
+    _SHARED_ATTRS = ("render_mode", "config", "observation_space", "action_space")
+
+    def __init__(self, config: JadConfig | None = None, *, n_envs: int, reward_func: str, n_workers: int = 1):
+        self._config = config or JadConfig()
+        reward = RewardFunc.from_name(reward_func)
+        self._reward_func = reward.name.lower()  # Canonical name, as the Node side expects
+        self._truncation_penalty = TRUNCATION_PENALTIES[reward]
+        self._max_episode_length = BASE_EPISODE_LENGTH * self._config.jad_count
+
+        if n_workers > 1:
+            self.env = JadShardedProcessWrapper(
+                self._config, n_envs=n_envs, n_workers=n_workers, reward_func=self._reward_func
+            )
+        else:
+            self.env = JadBatchProcessWrapper(self._config, n_envs=n_envs, reward_func=self._reward_func)
+
+        obs_dim = get_observation_dim(self._config)
+        self._action_dims = get_action_dims(self._config)
+        self._mask_splits = np.cumsum(self._action_dims)[:-1]
+
+        observation_space = spaces.Box(
+            low=-np.inf,
+            high=np.inf,
+            shape=(obs_dim,),
+            dtype=np.float32,
+        )
+        action_space = spaces.MultiDiscrete(self._action_dims)
+        super().__init__(n_envs, observation_space, action_space)
+
+        self.episode_lengths = np.zeros(n_envs, dtype=np.int64)
+        # Flattened per-env action masks, shape (n_envs, sum(action_dims))
+        self._masks = np.ones((n_envs, sum(self._action_dims)), dtype=np.bool_)
+        # Per-env infos for non-terminal steps, updated in place (finished envs get fresh dicts)
+        self._step_infos = [{"raw_reward": 0.0, "TimeLimit.truncated": False} for _ in range(n_envs)]
+
+    @property
+    def config(self) -> JadConfig:
+        return self._config
+
+    def reset(self) -> np.ndarray:
+        obs, _, _, masks, _ = self.env.reset()
+        self.episode_lengths[:] = 0
+        self._masks = masks
+        self._reset_seeds()
+        self._reset_options()
+        return obs
+
+    def step_async(self, actions: np.ndarray) -> None:
+        # Send right away so Node simulates while the caller does other work
+        self.env.step_async(actions)
+
+    def step_wait(self):
+        obs, rewards, terminated, masks, jads_killed = self.env.step_wait()
+        self.episode_lengths += 1
+
+        # Truncation is a training-only concept, applied here like JadGymEnv does
+        truncated = ~terminated & (self.episode_lengths >= self._max_episode_length)
+        rewards[truncated] += self._truncation_penalty
+        dones = terminated | truncated
+
+        infos: list[dict[str, Any]] = list(self._step_infos)
+        for info, r in zip(infos, rewards.tolist()):
+            info["raw_reward"] = r
+        done_ids = np.flatnonzero(dones)
+        if len(done_ids) > 0:
+            for i in done_ids:
+                killed = int(jads_killed[i])
+                infos[i] = {
+                    "raw_reward": float(rewards[i]),
+                    "TimeLimit.truncated": bool(truncated[i]),
+                    "outcome": "kill" if killed == self._config.jad_count else "death",
+                    "jads_killed": killed,
+                    "jad_count": self._config.jad_count,
+                    "terminal_observation": obs[i].copy(),
+                }
+
+            # Auto-reset finished envs in one round trip
+            reset_obs, _, _, reset_masks, _ = self.env.reset_envs(done_ids.tolist())
+            obs[done_ids] = reset_obs
+            masks[done_ids] = reset_masks
+            self.episode_lengths[done_ids] = 0
+
+        self._masks = masks
+        return obs, rewards, dones, infos
+
+    def action_masks(self) -> list[tuple[np.ndarray, ...]]:
+        """Per-env, per-head action masks (same format as JadGymEnv.action_masks)."""
+        return [tuple(np.split(mask, self._mask_splits)) for mask in self._masks]
+
+    def close(self) -> None:
+        self.env.close()
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> list[Any]:
+        indices = self._get_indices(indices)
+        if attr_name in self._SHARED_ATTRS:
+            return [getattr(self, attr_name) for _ in indices]
+        if attr_name == "episode_length":
+            return [int(self.episode_lengths[i]) for i in indices]
+        raise AttributeError(f"BatchedJadVecEnv envs have no per-env attribute {attr_name!r}")
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        raise AttributeError(f"BatchedJadVecEnv does not support setting per-env attribute {attr_name!r}")
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> list[Any]:
+        indices = list(self._get_indices(indices))
+        if method_name == "action_masks":
+            masks = self.action_masks()
+            return [masks[i] for i in indices]
+        if method_name == "reset":
+            # Same return value as JadGymEnv.reset, per env
+            obs, _, _, masks, _ = self.env.reset_envs(indices)
+            self._masks[indices] = masks
+            self.episode_lengths[indices] = 0
+            return [(env_obs, {}) for env_obs in obs]
+        raise AttributeError(f"BatchedJadVecEnv envs have no per-env method {method_name!r}")
+
+    def env_is_wrapped(self, wrapper_class: type[gym.Wrapper], indices: VecEnvIndices = None) -> list[bool]:
+        return [False for _ in self._get_indices(indices)]
+
+    def get_images(self) -> Sequence[np.ndarray | None]:
+        return [None for _ in range(self.num_envs)]
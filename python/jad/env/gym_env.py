@@ -1,3 +1,5 @@
+from enum import IntEnum
+
 import gymnasium as gym
 import numpy as np
 from gymnasium import spaces
@@ -6,16 +8,33 @@ from stable_baselines3.common.monitor import Monitor
 from jad.types import JadConfig
 from jad.actions import get_action_dims
 from jad.env.process_wrapper import EnvProcessWrapper
-from jad.env.observations import obs_to_array, get_observation_dim
+from jad.env.observations import get_observation_dim
 
 
 BASE_EPISODE_LENGTH = 300  # Per-jad episode length cap during training
 
+
+class RewardFunc(IntEnum):
+    """Reward functions implemented on the TypeScript side (src/core/reward)."""
+    SPARSE = 0
+    JAD1 = 1
+    JAD2 = 2
+    JAD3 = 3
+
+    @classmethod
+    def from_name(cls, name: str) -> "RewardFunc":
+        try:
+            return cls[name.upper()]
+        except KeyError:
+            available = ", ".join(member.name.lower() for member in cls)
+            raise ValueError(f"Unknown reward function: '{name}'. Available: {available}") from None
+
+
 TRUNCATION_PENALTIES = {
-    "sparse": -1.0,
-    "jad1": -150.0,
-    "jad2": -50.0,
-    "jad3": -50.0,
+    RewardFunc.SPARSE: -1.0,
+    RewardFunc.JAD1: -150.0,
+    RewardFunc.JAD2: -50.0,
+    RewardFunc.JAD3: -50.0,
 }
 
 
@@ -31,10 +50,12 @@ class JadGymEnv(gym.Env):
         super().__init__()
 
         self._config = config or JadConfig()
-        self._reward_func = reward_func
+        reward = RewardFunc.from_name(reward_func)
+        self._reward_func = reward.name.lower()  # Canonical name, as the Node side expects
+        self._truncation_penalty = TRUNCATION_PENALTIES[reward]
         self._max_episode_length = BASE_EPISODE_LENGTH * self._config.jad_count
 
-        self.env = EnvProcessWrapper(config=self._config, reward_func=reward_func)
+        self.env = EnvProcessWrapper(config=self._config, reward_func=self._reward_func)
 
         obs_dim = get_observation_dim(self._config)
         self._action_dims = get_action_dims(self._config)
@@ -49,6 +70,8 @@ class JadGymEnv(gym.Env):
         self.action_space = spaces.MultiDiscrete(self._action_dims)
 
         self.episode_length = 0
+        # Info returned on non-terminal steps, updated in place (terminal steps get a fresh dict)
+        self._step_info = {"raw_reward": 0.0}
         # Per-head action masks
         self._current_action_masks: tuple[np.ndarray, ...] = tuple(
             np.ones(dim, dtype=np.bool_) for dim in self._action_dims
@@ -63,46 +86,35 @@ class JadGymEnv(gym.Env):
 
         result = self.env.reset()
         self.episode_length = 0
+        self._current_action_masks = result.valid_action_mask
 
-        if result.valid_action_mask:
-            self._current_action_masks = tuple(
-                np.array(mask, dtype=np.bool_) for mask in result.valid_action_mask
-            )
-
-        obs_array = obs_to_array(result.observation, self._config)
-        return obs_array, {}
+        return result.observation, {}
 
     def step(self, action):
-        # Convert numpy array to list for JSON serialization
-        action_list = [int(a) for a in action]
-        result = self.env.step(action_list)
+        result = self.env.step(action)
         self.episode_length += 1
 
         reward = result.reward
-        obs = result.observation
-
-        if result.valid_action_mask:
-            self._current_action_masks = tuple(
-                np.array(mask, dtype=np.bool_) for mask in result.valid_action_mask
-            )
+        self._current_action_masks = result.valid_action_mask
 
         # Check for truncation (training-only concept)
         truncated = False
         if not result.terminated and self.episode_length >= self._max_episode_length:
             truncated = True
-            reward += TRUNCATION_PENALTIES.get(self._reward_func, -150.0)
+            reward += self._truncation_penalty
 
-        obs_array = obs_to_array(obs, self._config)
-
-        info = {"raw_reward": reward}
         if result.terminated or truncated:
-            jads_killed = sum(1 for jad in obs.jads if jad.hp <= 0)
-            all_jads_dead = jads_killed == len(obs.jads)
-            info["outcome"] = "kill" if all_jads_dead else "death"
-            info["jads_killed"] = jads_killed
-            info["jad_count"] = len(obs.jads)
-
-        return obs_array, reward, result.terminated, truncated, info
+            info = {
+                "raw_reward": reward,
+                "outcome": "kill" if result.jads_killed == self._config.jad_count else "death",
+                "jads_killed": result.jads_killed,
+                "jad_count": self._config.jad_count,
+            }
+        else:
+            info = self._step_info
+            info["raw_reward"] = reward
+
+        return result.observation, reward, result.terminated, truncated, info
 
     def action_masks(self) -> tuple[np.ndarray, ...]:
         """Return per-head action masks for MultiDiscrete masking."""
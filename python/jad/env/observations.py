@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 import numpy as np
 from jad.types import JadConfig, Observation
 
@@ -13,7 +15,11 @@ MAX_JAD_HP = 350
 MAX_HEALER_HP = 90
 JAD_PROJECTILE_DELAY = 3
 
+# Offset of the per-Jad continuous block (hp, x, y, ticks_until_impact) in the observation array
+JAD_CONTINUOUS_OFFSET = 10
+
 
+@lru_cache(maxsize=16)
 def get_observation_dim(config: JadConfig) -> int:
     jad_count = config.jad_count
     healers_per_jad = config.healers_per_jad
@@ -36,6 +42,7 @@ def get_observation_dim(config: JadConfig) -> int:
             healer_continuous + healer_target_onehot + binary)
 
 
+@lru_cache(maxsize=16)
 def get_continuous_feature_count(config: JadConfig) -> int:
     """Get the number of continuous features that should be normalized."""
     jad_count = config.jad_count
@@ -50,14 +57,19 @@ def get_continuous_feature_count(config: JadConfig) -> int:
     return player_continuous + next_projectile_continuous + jad_continuous + healer_continuous
 
 
+@lru_cache(maxsize=16)
 def get_normalize_mask(config: JadConfig) -> np.ndarray:
-    """Get mask for which features should be normalized (True = normalize)."""
+    """
+    Get mask for which features should be normalized (True = normalize).
+    The array is cached and shared between callers, so it is read-only.
+    """
     obs_dim = get_observation_dim(config)
     continuous_count = get_continuous_feature_count(config)
 
     # Continuous features first, then one-hot/binary
     mask = np.zeros(obs_dim, dtype=bool)
     mask[:continuous_count] = True
+    mask.setflags(write=False)
     return mask
 
 
@@ -76,7 +88,17 @@ def safe_divide(value: float, divisor: float) -> float:
     return value / divisor
 
 
-def obs_to_array(obs: Observation, config: JadConfig) -> np.ndarray:
+def _scatter_one_hot(out: np.ndarray, offset: int, indices: np.ndarray, size: int) -> None:
+    """Write one one-hot block of `size` per entry of `indices`, starting at `offset`.
+
+    Out-of-range indices leave their block all-zero, matching one_hot().
+    """
+    valid = (indices >= 0) & (indices < size)
+    positions = offset + np.arange(len(indices)) * size + indices
+    out[positions[valid]] = 1.0
+
+
+def obs_to_array(obs: Observation, config: JadConfig, out: np.ndarray | None = None) -> np.ndarray:
     """
     Convert Observation dataclass to numpy array with proper encoding.
 
@@ -88,6 +110,8 @@ def obs_to_array(obs: Observation, config: JadConfig) -> np.ndarray:
     Args:
         obs: The observation dataclass
         config: Jad configuration (jad_count, healers_per_jad)
+        out: Optional float32 array of shape (observation_dim,) to fill in place
+             (e.g. a row of a preallocated batch) instead of allocating one
 
     Returns:
         Array of shape (observation_dim,) where obs_dim = get_obs_dim(config)
@@ -96,10 +120,15 @@ def obs_to_array(obs: Observation, config: JadConfig) -> np.ndarray:
     healers_per_jad = config.healers_per_jad
     total_healers = jad_count * healers_per_jad
 
+    if out is None:
+        out = np.zeros(get_observation_dim(config), dtype=np.float32)
+    else:
+        out.fill(0.0)
+
     # ========== CONTINUOUS FEATURES ==========
 
     # Player continuous (9 features)
-    player_continuous = np.array([
+    out[:9] = (
         obs.player_hp / MAX_PLAYER_HP,
         obs.player_prayer / MAX_PRAYER,
         obs.player_ranged / MAX_RANGED_STAT,
@@ -109,78 +138,55 @@ def obs_to_array(obs: Observation, config: JadConfig) -> np.ndarray:
         safe_divide(obs.super_restore_doses, obs.starting_super_restore_doses),
         obs.player_location_x / MAX_COORD,
         obs.player_location_y / MAX_COORD,
-    ], dtype=np.float32)
+    )
 
     # Next projectile continuous (1 feature)
-    next_projectile_continuous = np.array([
-        obs.next_projectile_ticks / JAD_PROJECTILE_DELAY,
-    ], dtype=np.float32)
-
-    # Jad continuous (4 * jad_count features)
-    jad_continuous = []
-    for jad in obs.jads:
-        jad_continuous.extend([
-            jad.hp / MAX_JAD_HP,
-            jad.x / MAX_COORD,
-            jad.y / MAX_COORD,
-            jad.ticks_until_impact / JAD_PROJECTILE_DELAY,
-        ])
-    jad_continuous = np.array(jad_continuous, dtype=np.float32)
-
-    # Healer continuous (3 * total_healers features)
-    healer_continuous = []
-    for healer in obs.healers:
-        healer_continuous.extend([
-            healer.hp / MAX_HEALER_HP,
-            healer.x / MAX_COORD,
-            healer.y / MAX_COORD,
-        ])
-    healer_continuous = np.array(healer_continuous, dtype=np.float32)
+    out[9] = obs.next_projectile_ticks / JAD_PROJECTILE_DELAY
+
+    # Jad continuous (4 * jad_count features, interleaved per Jad)
+    jad_block = out[JAD_CONTINUOUS_OFFSET:JAD_CONTINUOUS_OFFSET + 4 * jad_count].reshape(jad_count, 4)
+    jad_block[:, 0] = obs.jads_hp / MAX_JAD_HP
+    jad_block[:, 1] = obs.jads_x / MAX_COORD
+    jad_block[:, 2] = obs.jads_y / MAX_COORD
+    jad_block[:, 3] = obs.jads_ticks_until_impact / JAD_PROJECTILE_DELAY
+    i = JAD_CONTINUOUS_OFFSET + 4 * jad_count
+
+    # Healer continuous (3 * total_healers features, interleaved per healer)
+    healer_block = out[i:i + 3 * total_healers].reshape(total_healers, 3)
+    healer_block[:, 0] = obs.healers_hp / MAX_HEALER_HP
+    healer_block[:, 1] = obs.healers_x / MAX_COORD
+    healer_block[:, 2] = obs.healers_y / MAX_COORD
+    i += 3 * total_healers
 
     # ========== ONE-HOT FEATURES ==========
 
     # Player target one-hot (1 + jad_count + total_healers)
     target_size = 1 + jad_count + total_healers
-    player_target_onehot = one_hot(obs.player_target, target_size)
+    out[i:i + target_size] = one_hot(obs.player_target, target_size)
+    i += target_size
 
     # Active prayer one-hot (4: none, mage, range, melee)
-    active_prayer_onehot = one_hot(obs.active_prayer, 4)
+    out[i:i + 4] = one_hot(obs.active_prayer, 4)
+    i += 4
 
     # Next projectile type one-hot (4: none, mage, range, melee)
-    next_projectile_type_onehot = one_hot(obs.next_projectile_type, 4)
+    out[i:i + 4] = one_hot(obs.next_projectile_type, 4)
+    i += 4
 
     # Per-Jad attack one-hot (4 * jad_count) - non-zero while projectile in flight
-    jad_attack_onehot = []
-    for jad in obs.jads:
-        jad_attack_onehot.append(one_hot(jad.attack, 4))
-    jad_attack_onehot = np.concatenate(jad_attack_onehot) if jad_attack_onehot else np.array([], dtype=np.float32)
+    _scatter_one_hot(out, i, obs.jads_attack, 4)
+    i += 4 * jad_count
 
     # Per-Healer target one-hot (3 * total_healers)
-    healer_target_onehot = []
-    for healer in obs.healers:
-        healer_target_onehot.append(one_hot(healer.target, 3))
-    healer_target_onehot = np.concatenate(healer_target_onehot) if healer_target_onehot else np.array([], dtype=np.float32)
+    _scatter_one_hot(out, i, obs.healers_target, 3)
+    i += 3 * total_healers
 
     # ========== BINARY FEATURES ==========
 
-    binary = np.array([
-        float(obs.rigour_active),
-        float(obs.healers_spawned),
-    ], dtype=np.float32)
-
-    # Concatenate all features
-    return np.concatenate([
-        player_continuous,
-        next_projectile_continuous,
-        jad_continuous,
-        healer_continuous,
-        player_target_onehot,
-        active_prayer_onehot,
-        next_projectile_type_onehot,
-        jad_attack_onehot,
-        healer_target_onehot,
-        binary,
-    ])
+    out[i] = float(obs.rigour_active)
+    out[i + 1] = float(obs.healers_spawned)
+
+    return out
 
 
 # For backwards compatibility with 1-Jad config
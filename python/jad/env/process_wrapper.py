@@ -1,9 +1,43 @@
-import subprocess
 import json
 import os
+import struct
+import subprocess
 from pathlib import Path
 
-from jad.types import JadConfig, Observation, StepResult, JadState, HealerState
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json is used when orjson is not installed
+    orjson = None
+
+from jad.actions import get_action_dims
+from jad.env.observations import get_observation_dim
+from jad.types import JadConfig, StepResult
+
+# Every message on stdin/stdout is a 4-byte big-endian payload length followed by the payload
+FRAME_HEADER = struct.Struct(">I")
+
+# Reply (little-endian), structure-of-arrays over the `count` envs a command addressed:
+# header (tag, mask length, count, reserved), then the flattened valid action masks as u64
+# bitfields (bit i = entry i), encoded observations (f32 * count * obs_dim), rewards (f32),
+# terminated flags (u8) and jads-killed counts (u8)
+REPLY_HEADER = struct.Struct("<cBHI")
+MASK_BITS = struct.Struct("<Q")
+REWARD = struct.Struct("<f")
+RESULT_TAG = b"R"
+ERROR_TAG = b"E"
+
+# Step command: tag followed by one little-endian int32 per action head.
+# Control commands (reset, close) are JSON objects, which never start with this tag.
+STEP_TAG = b"S"
+
+
+def _dumps(command: dict) -> bytes:
+    """Encode a control command as JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(command)
+    return json.dumps(command).encode()
 
 
 class EnvProcessWrapper:
@@ -12,6 +46,18 @@ class EnvProcessWrapper:
         self._script_dir = Path(__file__).parent
         self._config = config or JadConfig()
         self._reward_func = reward_func
+        self._num_envs = 1
+
+        self._obs_dim = get_observation_dim(self._config)
+
+        # Persistent action mask storage, overwritten in place by every reply;
+        # the per-head masks handed out in StepResult are views into it
+        action_dims = get_action_dims(self._config)
+        self._mask_len = sum(action_dims)
+        self._mask_shifts = np.arange(self._mask_len, dtype=np.uint64)
+        self._mask_scratch = np.empty(self._mask_len, dtype=np.uint64)
+        self._mask_flat = np.ones(self._mask_len, dtype=np.bool_)
+        self._mask_heads = tuple(np.split(self._mask_flat, np.cumsum(action_dims)[:-1]))
 
     @property
     def config(self) -> JadConfig:
@@ -19,32 +65,30 @@ class EnvProcessWrapper:
 
     def reset(self) -> StepResult:
         self._start_process()
-        result = self._send({"command": "reset"})
-        return StepResult(
-            observation=self._parse_observation(result["observation"]),
-            reward=0.0,
-            terminated=False,
-            valid_action_mask=result.get("valid_action_mask", []),
-        )
+        return self._parse_result(self._send({"command": "reset"}))
+
+    def step(self, action: np.ndarray | list[int]) -> StepResult:
+        self.step_async(action)
+        return self.step_wait()
 
-    def step(self, action: list[int]) -> StepResult:
+    def step_async(self, action: np.ndarray | list[int]) -> None:
+        """Send a step command without waiting for the result (collect it with step_wait)."""
         if self._proc is None:
             raise RuntimeError("Must call reset() before step()")
 
-        result = self._send({"command": "step", "action": action})
-        return StepResult(
-            observation=self._parse_observation(result["observation"]),
-            reward=result["reward"],
-            terminated=result["terminated"],
-            valid_action_mask=result.get("valid_action_mask", []),
-        )
+        action_bytes = np.ascontiguousarray(action, dtype="<i4").tobytes()
+        self._write_frame(STEP_TAG + action_bytes)
+
+    def step_wait(self) -> StepResult:
+        """Block until the result of the last step_async arrives."""
+        return self._parse_result(self._read_frame())
 
     def close(self) -> None:
         if self._proc is None:
             return
 
         try:
-            self._send({"command": "close"})
+            self._write({"command": "close"})
         except RuntimeError:
             pass  # Process may have already exited
         self._proc.wait()
@@ -62,87 +106,274 @@ class EnvProcessWrapper:
         env["JAD_COUNT"] = str(self._config.jad_count)
         env["HEALERS_PER_JAD"] = str(self._config.healers_per_jad)
         env["REWARD_FUNC"] = self._reward_func
+        env["NUM_ENVS"] = str(self._num_envs)
 
         self._proc = subprocess.Popen(
             ["node", str(bootstrap_path)],
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,  # Capture stderr to see errors
-            text=True,
             env=env,
         )
 
-    def _send(self, command: dict) -> dict:
+    def _send(self, command: dict) -> bytes:
+        return self._send_frame(_dumps(command))
+
+    def _send_frame(self, payload: bytes) -> bytes:
+        self._write_frame(payload)
+        return self._read_frame()
+
+    def _read_frame(self) -> bytes:
+        (length,) = FRAME_HEADER.unpack(self._read_exact(FRAME_HEADER.size))
+        return self._read_exact(length)
+
+    def _write(self, command: dict) -> None:
+        self._write_frame(_dumps(command))
+
+    def _write_frame(self, payload: bytes) -> None:
         if self._proc is None:
             raise RuntimeError("Environment not started")
 
         try:
-            self._proc.stdin.write(json.dumps(command) + "\n")
+            self._proc.stdin.write(FRAME_HEADER.pack(len(payload)) + payload)
             self._proc.stdin.flush()
         except BrokenPipeError:
             # Process crashed - try to get stderr for debugging
-            stderr = self._proc.stderr.read() if self._proc.stderr else ""
-            raise RuntimeError(f"Environment process crashed. Stderr: {stderr}")
-
-        line = self._proc.stdout.readline()
-        if not line:
-            stderr = self._proc.stderr.read() if self._proc.stderr else ""
-            raise RuntimeError(f"Environment closed unexpectedly. Stderr: {stderr}")
-
-        return json.loads(line)
-
-    def _parse_observation(self, obs: dict) -> Observation:
-        # Parse Jad states
-        jads = []
-        jads_data = obs.get("jads", [])
-        for jad_data in jads_data:
-            jads.append(JadState(
-                hp=jad_data.get("hp", 0),
-                attack=jad_data.get("attack", 0),
-                ticks_until_impact=jad_data.get("ticks_until_impact", 0),
-                x=jad_data.get("x", 0),
-                y=jad_data.get("y", 0),
-                alive=jad_data.get("alive", False),
-            ))
-
-        # Parse healer states
-        healers = []
-        healers_data = obs.get("healers", [])
-        for healer_data in healers_data:
-            healers.append(HealerState(
-                hp=healer_data.get("hp", 0),
-                x=healer_data.get("x", 0),
-                y=healer_data.get("y", 0),
-                target=healer_data.get("target", 0),
-            ))
-
-        return Observation(
-            player_hp=obs["player_hp"],
-            player_prayer=obs["player_prayer"],
-            player_ranged=obs.get("player_ranged", 99),
-            player_defence=obs.get("player_defence", 99),
-            player_location_x=obs.get("player_location_x", 0),
-            player_location_y=obs.get("player_location_y", 0),
-            player_target=obs.get("player_target", 0),
-
-            active_prayer=obs["active_prayer"],
-            rigour_active=obs.get("rigour_active", False),
-
-            jads=jads,
-            healers=healers,
-            healers_spawned=obs.get("healers_spawned", False),
-
-            next_projectile_type=obs.get("next_projectile_type", 0),
-            next_projectile_ticks=obs.get("next_projectile_ticks", 0),
-
-            bastion_doses=obs.get("bastion_doses", 0),
-            sara_brew_doses=obs.get("sara_brew_doses", 0),
-            super_restore_doses=obs.get("super_restore_doses", 0),
-            starting_bastion_doses=obs.get("starting_bastion_doses", 4),
-            starting_sara_brew_doses=obs.get("starting_sara_brew_doses", 4),
-            starting_super_restore_doses=obs.get("starting_super_restore_doses", 4),
+            raise RuntimeError(f"Environment process crashed. Stderr: {self._read_stderr()}")
+
+    def _read_exact(self, n: int) -> bytes:
+        data = self._proc.stdout.read(n)
+        if len(data) < n:
+            raise RuntimeError(f"Environment closed unexpectedly. Stderr: {self._read_stderr()}")
+        return data
+
+    def _read_stderr(self) -> str:
+        if self._proc.stderr is None:
+            return ""
+        return self._proc.stderr.read().decode(errors="replace")
+
+    def _unpack_reply(self, payload: bytes, count: int) -> tuple[int, int, int, int, int]:
+        """Validate a reply for `count` envs and return the offsets of its
+        (masks, observations, rewards, terminated, jads_killed) arrays."""
+        if payload[:1] == ERROR_TAG:
+            raise RuntimeError(f"Environment error: {payload[1:].decode(errors='replace')}")
+
+        tag, mask_len, reply_count, _ = REPLY_HEADER.unpack_from(payload)
+        if tag != RESULT_TAG:
+            raise RuntimeError(f"Unexpected reply tag from environment: {tag!r}")
+        if mask_len != self._mask_len:
+            raise RuntimeError(f"Action mask length mismatch: expected {self._mask_len}, got {mask_len}")
+        if reply_count != count:
+            raise RuntimeError(f"Expected results for {count} env(s), got {reply_count}")
+
+        mask_offset = REPLY_HEADER.size
+        obs_offset = mask_offset + 8 * count
+        reward_offset = obs_offset + 4 * count * self._obs_dim
+        terminated_offset = reward_offset + 4 * count
+        jads_killed_offset = terminated_offset + count
+        return mask_offset, obs_offset, reward_offset, terminated_offset, jads_killed_offset
+
+    def _parse_result(self, payload: bytes) -> StepResult:
+        mask_offset, obs_offset, reward_offset, terminated_offset, jads_killed_offset = (
+            self._unpack_reply(payload, 1)
+        )
+
+        # Zero-copy view into the reply; each reply is a fresh bytes object, so
+        # observations handed out for earlier steps are never overwritten
+        observation = np.frombuffer(payload, dtype="<f4", count=self._obs_dim, offset=obs_offset)
+
+        # Unpack the bitfield into the persistent mask without allocating
+        (mask_bits,) = MASK_BITS.unpack_from(payload, mask_offset)
+        np.right_shift(np.uint64(mask_bits), self._mask_shifts, out=self._mask_scratch)
+        np.bitwise_and(self._mask_scratch, 1, out=self._mask_scratch)
+        np.not_equal(self._mask_scratch, 0, out=self._mask_flat)
+
+        return StepResult(
+            observation=observation,
+            reward=REWARD.unpack_from(payload, reward_offset)[0],
+            terminated=bool(payload[terminated_offset]),
+            valid_action_mask=self._mask_heads,
+            jads_killed=payload[jads_killed_offset],
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JadBatchProcessWrapper(EnvProcessWrapper):
+    """
+    Drives n_envs environments hosted by a single Node process over one pipe.
+
+    A step sends every env's action in one frame and gets every env's result back
+    in one structure-of-arrays frame, so the whole batch costs a single round trip
+    and a single process instead of one per env.
+    """
+
+    def __init__(self, config: JadConfig | None = None, *, n_envs: int, reward_func: str):
+        super().__init__(config, reward_func=reward_func)
+        self._num_envs = n_envs
+        self._pending_reset_count = 0  # Envs addressed by the last reset_envs_async
+
+    @property
+    def num_envs(self) -> int:
+        return self._num_envs
+
+    def reset(self) -> tuple[np.ndarray, ...]:
+        """Reset all envs. Returns (obs, rewards, terminated, masks, jads_killed) for the batch."""
+        self.reset_async()
+        return self.reset_wait()
+
+    def reset_async(self) -> None:
+        """Send a reset of all envs without waiting for the result (collect it with reset_wait)."""
+        self._start_process()
+        self._write({"command": "reset"})
+
+    def reset_wait(self) -> tuple[np.ndarray, ...]:
+        """Block until the batch result of the last reset_async arrives."""
+        return self._parse_batch(self._read_frame(), self._num_envs)
+
+    def reset_envs(self, env_ids: list[int]) -> tuple[np.ndarray, ...]:
+        """Reset only the given envs. Returns (obs, rewards, terminated, masks, jads_killed) for those envs."""
+        if len(env_ids) == 0:
+            return self._empty_batch()
+
+        self.reset_envs_async(env_ids)
+        return self.reset_envs_wait()
+
+    def reset_envs_async(self, env_ids: list[int]) -> None:
+        """Send a reset of the given envs without waiting for the result (collect it with reset_envs_wait)."""
+        if self._proc is None:
+            raise RuntimeError("Must call reset() before reset_envs()")
+
+        self._write({"command": "reset", "env_ids": list(env_ids)})
+        self._pending_reset_count = len(env_ids)
+
+    def reset_envs_wait(self) -> tuple[np.ndarray, ...]:
+        """Block until the result of the last reset_envs_async arrives."""
+        return self._parse_batch(self._read_frame(), self._pending_reset_count)
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, ...]:
+        """Step all envs with actions of shape (n_envs, n_heads). Returns (obs, rewards, terminated, masks, jads_killed)."""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_wait(self) -> tuple[np.ndarray, ...]:
+        """Block until the batch result of the last step_async arrives."""
+        return self._parse_batch(self._read_frame(), self._num_envs)
+
+    def _empty_batch(self) -> tuple[np.ndarray, ...]:
+        """Results for zero envs: the fields _parse_batch returns, with no rows."""
+        return (
+            np.empty((0, self._obs_dim), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.bool_),
+            np.empty((0, self._mask_len), dtype=np.bool_),
+            np.empty(0, dtype=np.uint8),
         )
 
+    def _parse_batch(self, payload: bytes, count: int) -> tuple[np.ndarray, ...]:
+        mask_offset, obs_offset, reward_offset, terminated_offset, jads_killed_offset = (
+            self._unpack_reply(payload, count)
+        )
+
+        # Each field is one contiguous array in the reply; obs and rewards are copied
+        # because the vec env patches them in place on auto-reset and truncation
+        mask_bits = np.frombuffer(payload, dtype="<u8", count=count, offset=mask_offset)
+        obs = np.frombuffer(payload, dtype="<f4", count=count * self._obs_dim, offset=obs_offset)
+        rewards = np.frombuffer(payload, dtype="<f4", count=count, offset=reward_offset)
+        terminated = np.frombuffer(payload, dtype=np.bool_, count=count, offset=terminated_offset)
+        jads_killed = np.frombuffer(payload, dtype=np.uint8, count=count, offset=jads_killed_offset)
+
+        masks = ((mask_bits[:, None] >> self._mask_shifts) & 1).astype(np.bool_)
+
+        return obs.reshape(count, self._obs_dim).copy(), rewards.copy(), terminated, masks, jads_killed
+
+
+class JadShardedProcessWrapper:
+    """
+    Spreads n_envs environments over n_workers Node processes, each a
+    JadBatchProcessWrapper shard, so the shards simulate in parallel.
+
+    Same interface as JadBatchProcessWrapper. Every command is written to all
+    shards before any reply is read, so a batch still costs one round trip, bounded
+    by the slowest shard instead of the sum over all envs.
+    """
+
+    def __init__(self, config: JadConfig | None = None, *, n_envs: int, n_workers: int, reward_func: str):
+        if n_workers < 1:
+            raise ValueError(f"n_workers must be >= 1, got {n_workers}")
+
+        sizes = [n_envs // n_workers + (i < n_envs % n_workers) for i in range(min(n_workers, n_envs))]
+        self._shards = [JadBatchProcessWrapper(config, n_envs=n, reward_func=reward_func) for n in sizes]
+        # First global env id of each shard
+        self._offsets = np.cumsum([0] + sizes[:-1])
+        self._num_envs = n_envs
+
+    @property
+    def config(self) -> JadConfig:
+        return self._shards[0].config
+
+    @property
+    def num_envs(self) -> int:
+        return self._num_envs
+
+    def reset(self) -> tuple[np.ndarray, ...]:
+        """Reset all envs. Returns (obs, rewards, terminated, masks, jads_killed) for the batch."""
+        for shard in self._shards:
+            shard.reset_async()
+        return self._concat(shard.reset_wait() for shard in self._shards)
+
+    def reset_envs(self, env_ids: list[int]) -> tuple[np.ndarray, ...]:
+        """Reset only the given envs. Returns (obs, rewards, terminated, masks, jads_killed) for those envs."""
+        if len(env_ids) == 0:
+            return self._shards[0].reset_envs([])
+
+        ids = np.asarray(env_ids)
+        shard_ids = np.searchsorted(self._offsets, ids, side="right") - 1
+
+        pending = []
+        for s, shard in enumerate(self._shards):
+            selected = np.flatnonzero(shard_ids == s)
+            if len(selected) > 0:
+                shard.reset_envs_async((ids[selected] - self._offsets[s]).tolist())
+                pending.append((shard, selected))
+
+        # Scatter each shard's results back into the order env_ids were given in
+        results = None
+        for shard, selected in pending:
+            shard_results = shard.reset_envs_wait()
+            if results is None:
+                results = tuple(np.empty((len(ids),) + r.shape[1:], dtype=r.dtype) for r in shard_results)
+            for out, r in zip(results, shard_results):
+                out[selected] = r
+        return results
+
+    def step(self, actions: np.ndarray) -> tuple[np.ndarray, ...]:
+        """Step all envs with actions of shape (n_envs, n_heads). Returns (obs, rewards, terminated, masks, jads_killed)."""
+        self.step_async(actions)
+        return self.step_wait()
+
+    def step_async(self, actions: np.ndarray) -> None:
+        """Send each shard its slice of the actions without waiting for results."""
+        for shard, offset in zip(self._shards, self._offsets):
+            shard.step_async(actions[offset:offset + shard.num_envs])
+
+    def step_wait(self) -> tuple[np.ndarray, ...]:
+        """Block until every shard's result of the last step_async arrives."""
+        return self._concat(shard.step_wait() for shard in self._shards)
+
+    def close(self) -> None:
+        for shard in self._shards:
+            shard.close()
+
+    @staticmethod
+    def _concat(shard_results) -> tuple[np.ndarray, ...]:
+        """Concatenate whole-shard results (read in shard order) into env order."""
+        return tuple(np.concatenate(field) for field in zip(*shard_results))
+
     def __enter__(self):
         return self
 
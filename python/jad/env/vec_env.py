@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecEnv, VecMonitor
+
+from jad.env.batched_env import BatchedJadVecEnv
+from jad.env.gym_env import make_jad_env
+from jad.types import JadConfig
+
+# Vectorized env backends accepted by make_vec_jad_env
+VEC_ENV_TYPES = ("dummy", "subproc", "batched")
+
+
+def default_vec_env(n_envs: int) -> str:
+    """Backend used when none is requested: subproc for 4+ envs, dummy otherwise."""
+    return "subproc" if n_envs >= 4 else "dummy"
+
+
+def make_vec_jad_env(
+    config: JadConfig | None = None,
+    *,
+    n_envs: int,
+    reward_func: str,
+    vec_env: str | None = None,
+    n_workers: int | None = None,
+) -> VecEnv:
+    """
+    Create n_envs Jad environments behind an SB3 VecEnv, with Monitor episode stats.
+
+    Every env step is a round trip to a Node process, so the backends differ in how
+    those round trips overlap:
+        dummy:   one Node process per env, stepped serially in this process
+        subproc: one Node process per env, each stepped from its own worker process
+        batched: envs split across n_workers Node processes (default: one per CPU
+                 core, at most n_envs), each stepping its share with one message
+
+    vec_env=None picks default_vec_env(n_envs).
+    """
+    if vec_env is None:
+        vec_env = default_vec_env(n_envs)
+
+    if vec_env == "batched":
+        if n_workers is None:
+            n_workers = min(n_envs, os.cpu_count() or 1)
+        # VecMonitor supplies the episode stats Monitor adds to the per-env factories
+        return VecMonitor(BatchedJadVecEnv(config, n_envs=n_envs, reward_func=reward_func, n_workers=n_workers))
+
+    env_fns = [make_jad_env(config, reward_func=reward_func) for _ in range(n_envs)]
+    if vec_env == "subproc":
+        # forkserver avoids forking the parent after torch has started its threads;
+        # platforms without it (Windows) fall back to spawn
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return SubprocVecEnv(env_fns, start_method=start_method)
+    if vec_env == "dummy":
+        return DummyVecEnv(env_fns)
+    raise ValueError(f"Unknown vec_env {vec_env!r}, expected one of {VEC_ENV_TYPES}")
@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 from stable_baselines3.common.vec_env import VecEnvWrapper
 from stable_baselines3.common.vec_env.base_vec_env import VecEnv
@@ -5,11 +7,87 @@ from stable_baselines3.common.vec_env.base_vec_env import VecEnv
 from jad.types import JadConfig
 from jad.env.observations import get_normalize_mask, NORMALIZE_MASK
 
+try:
+    from numba import njit
+except ImportError:  # Optional: RunningNormalizer falls back to its numpy implementation
+    njit = None
+
+
+def _merge_scalar_kernel(mean: float, var: float, count: int, x: np.ndarray) -> tuple[float, float, int]:
+    """Merge a flat batch of scalars into running (mean, var, count) with the parallel update."""
+    n = x.shape[0]
+    # Two passes over the batch (mean, then squared deviations) to avoid cancellation
+    batch_sum = 0.0
+    for i in range(n):
+        batch_sum += float(x[i])
+    batch_mean = batch_sum / n
+    batch_m2 = 0.0
+    for i in range(n):
+        diff = float(x[i]) - batch_mean
+        batch_m2 += diff * diff
+    batch_var = batch_m2 / n
+
+    delta = batch_mean - mean
+    total_count = count + n
+    new_mean = mean + delta * n / total_count
+    m2 = var * count + batch_var * n + delta * delta * count * n / total_count
+    return new_mean, m2 / total_count, total_count
+
+
+def _merge_vector_kernel(
+    mean: np.ndarray, var: np.ndarray, count: int, x: np.ndarray
+) -> tuple[np.ndarray, np.ndarray, int]:
+    """Merge a (n, d) batch into running per-feature (mean, var, count) with the parallel update."""
+    n, d = x.shape
+    # Two passes over the batch (mean, then squared deviations) to avoid cancellation
+    batch_mean = np.zeros(d)
+    for i in range(n):
+        for j in range(d):
+            batch_mean[j] += float(x[i, j])
+    for j in range(d):
+        batch_mean[j] /= n
+    batch_m2 = np.zeros(d)
+    for i in range(n):
+        for j in range(d):
+            diff = float(x[i, j]) - batch_mean[j]
+            batch_m2[j] += diff * diff
+
+    total_count = count + n
+    new_mean = np.empty(d)
+    new_var = np.empty(d)
+    for j in range(d):
+        batch_var = batch_m2[j] / n
+        delta = batch_mean[j] - mean[j]
+        new_mean[j] = mean[j] + delta * n / total_count
+        m2 = var[j] * count + batch_var * n + delta * delta * count * n / total_count
+        new_var[j] = m2 / total_count
+    return new_mean, new_var, total_count
+
+
+def _normalize_kernel(x: np.ndarray, mean: np.ndarray, inv_std: np.ndarray, out: np.ndarray) -> None:
+    """out = (x - mean) * inv_std for a (n, d) batch, in one pass without temporaries."""
+    n, d = x.shape
+    for i in range(n):
+        for j in range(d):
+            out[i, j] = (x[i, j] - mean[j]) * inv_std[j]
+
+
+if njit is not None:
+    # No fastmath: reassociation would make the statistics differ from the numpy path
+    _merge_scalar = njit(cache=True)(_merge_scalar_kernel)
+    _merge_vector = njit(cache=True)(_merge_vector_kernel)
+    _normalize_batch = njit(cache=True)(_normalize_kernel)
+else:
+    _merge_scalar = None
+    _merge_vector = None
+    _normalize_batch = None
+
 
 class RunningNormalizer:
     """
     Maintains running mean and variance for online normalization.
-    Uses Welford's algorithm for numerically stable online computation.
+    Each batch is merged into the running statistics with the parallel
+    (Chan et al.) mean/variance update.
     """
 
     def __init__(self, shape: tuple[int, ...], epsilon: float = 1e-8):
@@ -18,16 +96,33 @@ class RunningNormalizer:
         self.mean = np.zeros(shape, dtype=np.float64)
         self.var = np.ones(shape, dtype=np.float64)
         self.count = 0
+        self._refresh_cache()
+
+    def _refresh_cache(self) -> None:
+        """Refresh the float32 mean and 1/std used by normalize(); call after mean/var change."""
+        self._mean_f32 = np.array(self.mean, dtype=np.float32)
+        self._inv_std_f32 = np.array(1.0 / np.sqrt(self.var + self.epsilon), dtype=np.float32)
 
     def update(self, x: np.ndarray) -> None:
         """Update running statistics with new observation(s)."""
-        x = np.asarray(x, dtype=np.float64)
+        x = np.asarray(x)
         if x.shape == self.shape:
             x = x.reshape(1, *self.shape)
 
+        if _merge_vector is not None and x.ndim == 2:
+            self.mean, self.var, count = _merge_vector(self.mean, self.var, self.count, x)
+            self.count = int(count)
+            self._refresh_cache()
+            return
+
+        # Single pass over x: float64 sum and sum of squares, no float64 copy of x.
+        # Batches are small (one row per env), so the sumsq form is accurate here;
+        # the running stats are still merged with the stable parallel update below.
         batch_count = x.shape[0]
-        batch_mean = x.mean(axis=0)
-        batch_var = x.var(axis=0)
+        batch_sum = x.sum(axis=0, dtype=np.float64)
+        batch_sumsq = np.einsum("i...,i...->...", x, x, dtype=np.float64)
+        batch_mean = batch_sum / batch_count
+        batch_var = np.maximum(batch_sumsq / batch_count - batch_mean**2, 0.0)
 
         # Parallel Welford algorithm
         delta = batch_mean - self.mean
@@ -41,18 +136,75 @@ class RunningNormalizer:
         self.mean = new_mean
         self.var = new_var
         self.count = total_count
+        self._refresh_cache()
+
+    def update_scalar_batch(self, x: np.ndarray) -> None:
+        """
+        Fast path of update() for a flat batch of scalars (normalizers with shape=()).
+        Merges on Python floats (or in a numba kernel), so no temporary arrays are created.
+        """
+        if _merge_scalar is not None:
+            mean, var, count = _merge_scalar(float(self.mean), float(self.var), self.count, x)
+            self.mean = np.float64(mean)
+            self.var = np.float64(var)
+            self.count = int(count)
+            self._mean_f32 = np.float32(mean)
+            self._inv_std_f32 = np.float32(1.0 / math.sqrt(var + self.epsilon))
+            return
+
+        batch_count = x.size
+        batch_mean = float(x.sum()) / batch_count
+        batch_var = max(float(np.dot(x, x)) / batch_count - batch_mean * batch_mean, 0.0)
+
+        mean = float(self.mean)
+        delta = batch_mean - mean
+        total_count = self.count + batch_count
+        m2 = (float(self.var) * self.count + batch_var * batch_count
+              + delta * delta * self.count * batch_count / total_count)
+
+        new_var = m2 / total_count
 
-    def normalize(self, x: np.ndarray) -> np.ndarray:
-        """Normalize observation using running statistics."""
-        return (x - self.mean.astype(np.float32)) / np.sqrt(self.var.astype(np.float32) + self.epsilon)
+        self.mean = np.float64(mean + delta * batch_count / total_count)
+        self.var = np.float64(new_var)
+        self.count = total_count
+        self._mean_f32 = np.float32(self.mean)
+        self._inv_std_f32 = np.float32(1.0 / math.sqrt(new_var + self.epsilon))
+
+    @property
+    def inv_std(self) -> np.ndarray:
+        """Cached float32 1/sqrt(var + epsilon)."""
+        return self._inv_std_f32
+
+    def normalize(self, x: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """Normalize observation using running statistics (in place into `out` if given)."""
+        if (
+            _normalize_batch is not None
+            and x.ndim == 2
+            and x.dtype == np.float32
+            and (out is None or out.dtype == np.float32)
+        ):
+            if out is None:
+                out = np.empty(x.shape, dtype=np.float32)
+            _normalize_batch(x, self._mean_f32, self._inv_std_f32, out)
+            return out
+
+        out = np.subtract(x, self._mean_f32, out=out)
+        return np.multiply(out, self._inv_std_f32, out=out)
+
+    def snapshot(self) -> dict:
+        """Current statistics without copying (only valid until the next update)."""
+        return {"mean": self.mean, "var": self.var, "count": self.count}
 
     def state_dict(self) -> dict:
         return {"mean": self.mean.copy(), "var": self.var.copy(), "count": self.count}
 
     def load_state_dict(self, state: dict) -> None:
-        self.mean = state["mean"].copy()
-        self.var = state["var"].copy()
+        # Updates rebind mean/var rather than writing into them, so sharing the
+        # caller's arrays is safe; asarray only copies on a dtype change
+        self.mean = np.asarray(state["mean"], dtype=np.float64)
+        self.var = np.asarray(state["var"], dtype=np.float64)
         self.count = state["count"]
+        self._refresh_cache()
 
 
 class SelectiveVecNormalize(VecEnvWrapper):
@@ -67,6 +219,10 @@ class SelectiveVecNormalize(VecEnvWrapper):
     - Tracks rolling discounted returns per environment
     - Normalizes rewards by the std of returns (not mean-centered)
     - Resets returns at episode boundaries
+
+    Returned observations alternate between two wrapper-owned buffers, so an array
+    stays valid for one further step (enough for SB3, which keeps the previous
+    observation until it is added to the rollout buffer). Copy it to keep it longer.
     """
 
     def __init__(
@@ -106,14 +262,26 @@ class SelectiveVecNormalize(VecEnvWrapper):
         else:
             self.normalize_mask = NORMALIZE_MASK
 
+        # Continuous feature selector: a slice when the mask is one contiguous run
+        # (the standard layout, continuous features first), else an index array
+        cont_idx = np.flatnonzero(self.normalize_mask)
+        if len(cont_idx) > 0 and cont_idx[-1] - cont_idx[0] + 1 == len(cont_idx):
+            self._cont_sel = slice(int(cont_idx[0]), int(cont_idx[-1]) + 1)
+        else:
+            self._cont_sel = cont_idx
+
         # Observation normalizer for continuous features
-        n_continuous = int(np.sum(self.normalize_mask))
+        n_continuous = len(cont_idx)
         self.obs_normalizer = RunningNormalizer(shape=(n_continuous,))
 
         # Reward normalizer: tracks std of discounted returns
         self.ret_normalizer = RunningNormalizer(shape=())
         self.returns = np.zeros(self.num_envs, dtype=np.float64)
 
+        # Double-buffered normalized observations (allocated on first use)
+        self._out_bufs: list[np.ndarray] = []
+        self._out_idx = 0
+
     def reset(self):
         """Reset all environments and normalize observations."""
         obs = self.venv.reset()
@@ -143,21 +311,22 @@ class SelectiveVecNormalize(VecEnvWrapper):
             return rewards
 
         # Update rolling discounted returns
-        self.returns = self.returns * self.gamma + rewards
+        self.returns *= self.gamma
+        self.returns += rewards
 
         # Update running statistics with current returns
         if self.training:
-            self.ret_normalizer.update(self.returns)
+            self.ret_normalizer.update_scalar_batch(self.returns)
 
         # Normalize by std of returns (NOT mean-centered)
         # This is the key difference from observation normalization
-        normalized = rewards / np.sqrt(self.ret_normalizer.var + 1e-8)
-        normalized = np.clip(normalized, -self.clip_reward, self.clip_reward)
+        normalized = np.multiply(rewards, self.ret_normalizer.inv_std, dtype=np.float32)
+        np.clip(normalized, -self.clip_reward, self.clip_reward, out=normalized)
 
         # Reset returns for finished episodes
         self.returns[dones] = 0
 
-        return normalized.astype(np.float32)
+        return normalized
 
     def _normalize_obs(self, obs: np.ndarray) -> np.ndarray:
         """
@@ -172,26 +341,41 @@ class SelectiveVecNormalize(VecEnvWrapper):
         if not self.norm_obs:
             return obs
 
-        # Extract continuous features from all envs
-        continuous = obs[:, self.normalize_mask]  # (n_envs, n_continuous)
+        if not self._out_bufs or self._out_bufs[0].shape != obs.shape:
+            self._out_bufs = [np.empty(obs.shape, dtype=np.float32) for _ in range(2)]
+        self._out_idx ^= 1
+
+        return self.normalize_obs_into(obs, self._out_bufs[self._out_idx])
+
+    def normalize_obs_into(self, obs: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """
+        Normalize observations into a caller-provided float32 array (updating stats when training).
+
+        Args:
+            obs: Batch of observations from all envs, shape (n_envs, obs_dim)
+            out: Destination array with the same shape (may be obs itself)
+
+        Returns:
+            out
+        """
+        np.copyto(out, obs)
+
+        # Continuous features from all envs (a view when the selector is a slice)
+        continuous = out[:, self._cont_sel]  # (n_envs, n_continuous)
 
         # Update running stats with batch from all envs
         if self.training:
             self.obs_normalizer.update(continuous)
 
-        # Normalize continuous features
-        normalized_continuous = self.obs_normalizer.normalize(continuous)
-
-        # Clip to prevent extreme values
-        normalized_continuous = np.clip(
-            normalized_continuous, -self.clip_obs, self.clip_obs
-        )
+        # Normalize and clip continuous features in place
+        self.obs_normalizer.normalize(continuous, out=continuous)
+        np.clip(continuous, -self.clip_obs, self.clip_obs, out=continuous)
 
-        # Reconstruct full observation with normalized continuous features
-        result = obs.copy()
-        result[:, self.normalize_mask] = normalized_continuous
+        # Index-array selection gathers a copy, so it has to be written back
+        if not isinstance(self._cont_sel, slice):
+            out[:, self._cont_sel] = continuous
 
-        return result.astype(np.float32)
+        return out
 
     def get_normalizer_state(self) -> dict:
         """Get all normalizer states for saving."""
@@ -209,8 +393,9 @@ class SelectiveVecNormalize(VecEnvWrapper):
 
     def save_normalizer(self, path: str) -> None:
         """Save normalizer stats to file."""
-        obs_state = self.obs_normalizer.state_dict()
-        ret_state = self.ret_normalizer.state_dict()
+        # np.savez serializes straight from the arrays, so no copy is needed
+        obs_state = self.obs_normalizer.snapshot()
+        ret_state = self.ret_normalizer.snapshot()
         np.savez(
             path,
             # Observation normalizer
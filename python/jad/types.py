@@ -1,8 +1,12 @@
+from collections.abc import Sequence
 from dataclasses import dataclass, field
 from enum import Enum, auto
+from typing import NamedTuple
 
+import numpy as np
 
-@dataclass
+
+@dataclass(frozen=True, slots=True)
 class JadConfig:
     jad_count: int = 1
     healers_per_jad: int = 3
@@ -26,8 +30,8 @@ class TerminationState(Enum):
     TRUNCATED = auto()     # Hit max episode length
 
 
-@dataclass
-class JadState:
+class JadState(NamedTuple):
+    """Per-Jad view of an Observation (debugging/CLI only, see Observation.jads)."""
     hp: int
     attack: int              # 0=none, 1=mage, 2=range, 3=melee (non-zero while projectile in flight)
     ticks_until_impact: int  # 0=none, 1-3=ticks remaining until projectile hits
@@ -36,15 +40,27 @@ class JadState:
     alive: bool
 
 
-@dataclass
-class HealerState:
+class HealerState(NamedTuple):
+    """Per-healer view of an Observation (debugging/CLI only, see Observation.healers)."""
     hp: int
     x: int
     y: int
     target: int  # 0=not_present, 1=jad, 2=player
 
 
-@dataclass
+def _int_array() -> np.ndarray:
+    return np.zeros(0, dtype=np.int32)
+
+
+def _bool_array() -> np.ndarray:
+    return np.zeros(0, dtype=np.bool_)
+
+
+def _column(items: Sequence, name: str, dtype) -> np.ndarray:
+    return np.fromiter((getattr(item, name) for item in items), dtype=dtype, count=len(items))
+
+
+@dataclass(frozen=True, slots=True)
 class Observation:
     # Player state
     player_hp: int
@@ -64,11 +80,19 @@ class Observation:
     sara_brew_doses: int
     super_restore_doses: int
 
-    # Dynamic Jad state
-    jads: list[JadState] = field(default_factory=list)
+    # Dynamic Jad state, one entry per Jad (shape (jad_count,))
+    jads_hp: np.ndarray = field(default_factory=_int_array)
+    jads_attack: np.ndarray = field(default_factory=_int_array)
+    jads_ticks_until_impact: np.ndarray = field(default_factory=_int_array)
+    jads_x: np.ndarray = field(default_factory=_int_array)
+    jads_y: np.ndarray = field(default_factory=_int_array)
+    jads_alive: np.ndarray = field(default_factory=_bool_array)
 
-    # Dynamic healer state (flattened)
-    healers: list[HealerState] = field(default_factory=list)
+    # Dynamic healer state, flattened (shape (jad_count * healers_per_jad,))
+    healers_hp: np.ndarray = field(default_factory=_int_array)
+    healers_x: np.ndarray = field(default_factory=_int_array)
+    healers_y: np.ndarray = field(default_factory=_int_array)
+    healers_target: np.ndarray = field(default_factory=_int_array)
 
     # Whether any healers have spawned
     healers_spawned: bool = False
@@ -82,10 +106,56 @@ class Observation:
     starting_sara_brew_doses: int = 4
     starting_super_restore_doses: int = 4
 
+    @classmethod
+    def from_entities(
+        cls, jads: Sequence[JadState], healers: Sequence[HealerState], **fields
+    ) -> "Observation":
+        """Build an Observation from per-Jad/per-healer states (the former jads=/healers= fields)."""
+        return cls(
+            **fields,
+            jads_hp=_column(jads, "hp", np.int32),
+            jads_attack=_column(jads, "attack", np.int32),
+            jads_ticks_until_impact=_column(jads, "ticks_until_impact", np.int32),
+            jads_x=_column(jads, "x", np.int32),
+            jads_y=_column(jads, "y", np.int32),
+            jads_alive=_column(jads, "alive", np.bool_),
+            healers_hp=_column(healers, "hp", np.int32),
+            healers_x=_column(healers, "x", np.int32),
+            healers_y=_column(healers, "y", np.int32),
+            healers_target=_column(healers, "target", np.int32),
+        )
+
+    @property
+    def jads(self) -> list[JadState]:
+        return [
+            JadState(*fields)
+            for fields in zip(
+                self.jads_hp.tolist(),
+                self.jads_attack.tolist(),
+                self.jads_ticks_until_impact.tolist(),
+                self.jads_x.tolist(),
+                self.jads_y.tolist(),
+                self.jads_alive.tolist(),
+            )
+        ]
+
+    @property
+    def healers(self) -> list[HealerState]:
+        return [
+            HealerState(*fields)
+            for fields in zip(
+                self.healers_hp.tolist(),
+                self.healers_x.tolist(),
+                self.healers_y.tolist(),
+                self.healers_target.tolist(),
+            )
+        ]
+
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class StepResult:
-    observation: Observation
+    observation: np.ndarray  # Encoded observation, same layout as obs_to_array
     reward: float
     terminated: bool
-    valid_action_mask: list[list[bool]] = field(default_factory=list)  # Per-head masks
+    valid_action_mask: tuple[np.ndarray, ...] = ()  # Per-head boolean masks (reused between steps)
+    jads_killed: int = 0  # Jads with hp <= 0
@@ -1,5 +1,7 @@
 import torch
 import torch.nn as nn
+from torch.nn.utils.rnn import PackedSequence, pack_padded_sequence, pad_packed_sequence
+from torch.utils.checkpoint import checkpoint
 
 
 class LSTMPolicy(nn.Module):
@@ -10,6 +12,7 @@ class LSTMPolicy(nn.Module):
         action_dims: list[int],
         lstm_hidden_size: int = 256,
         n_lstm_layers: int = 1,
+        checkpoint_segments: int = 1,
     ):
         super().__init__()
 
@@ -18,6 +21,8 @@ class LSTMPolicy(nn.Module):
         self.num_heads = len(action_dims)
         self.lstm_hidden_size = lstm_hidden_size
         self.n_lstm_layers = n_lstm_layers
+        # Time chunks for activation checkpointing of padded training batches (1 = off)
+        self.checkpoint_segments = checkpoint_segments
 
         # Feature extractor (matches SB3's default MLP extractor)
         # Default: two layers of 64 units each
@@ -37,22 +42,38 @@ class LSTMPolicy(nn.Module):
             batch_first=True,
         )
 
-        # Policy heads (one per action head)
-        self.policy_heads = nn.ModuleList([
-            nn.Linear(lstm_hidden_size, dim) for dim in action_dims
-        ])
+        # Policy heads (one per action head) and value head (critic), fused into one
+        # Linear whose output is split as [head_0 logits, ..., head_n logits, value]
+        self.head_sizes = list(action_dims) + [1]
+        self.heads = nn.Linear(lstm_hidden_size, sum(self.head_sizes))
 
-        # Value head (critic)
-        self.value_head = nn.Linear(lstm_hidden_size, 1)
+        # Checkpoints saved before the fusion have separate policy_heads.* / value_head.*
+        self._register_load_state_dict_pre_hook(self._fuse_legacy_heads)
+
+    def _fuse_legacy_heads(self, state_dict, prefix, *args) -> None:
+        """Concatenate separate per-head Linear weights into the fused heads Linear."""
+        value_prefix = prefix + "value_head."
+        if value_prefix + "weight" not in state_dict:
+            return
+
+        for param in ("weight", "bias"):
+            parts = [state_dict.pop(f"{prefix}policy_heads.{i}.{param}") for i in range(self.num_heads)]
+            parts.append(state_dict.pop(value_prefix + param))
+            state_dict[prefix + "heads." + param] = torch.cat(parts, dim=0)
 
     def forward(
         self,
         obs: torch.Tensor,
         lstm_states: tuple[torch.Tensor, torch.Tensor] | None = None,
         mask: torch.Tensor | None = None,
+        lengths: torch.Tensor | None = None,
     ) -> tuple[list[torch.Tensor], torch.Tensor, tuple[torch.Tensor, torch.Tensor]]:
         """
-        Forward pass.
+        Forward pass (dispatches to forward_step / forward_seq / forward_packed).
+
+        Passing `lengths` with padded (batch, seq_len, obs_dim) input runs the LSTM
+        over the real steps only (eager training; not available when scripted).
+        With checkpoint_segments > 1 such input goes to forward_checkpointed instead.
 
         Returns:
             logits: list of tensors, one per action head
@@ -60,62 +81,127 @@ class LSTMPolicy(nn.Module):
             values: (batch, seq_len, 1) or (batch, 1)
             lstm_states: tuple of (h, c)
         """
-        # Handle single timestep input
-        single_step = obs.dim() == 2
-        if single_step:
-            obs = obs.unsqueeze(1)  # (batch, 1, obs_dim)
-
-        batch_size, seq_len, _ = obs.shape
-
-        # Extract features
-        features = self.features_extractor(obs)  # (batch, seq_len, 64)
-
-        # Initialize LSTM states if not provided
         if lstm_states is None:
-            h0 = torch.zeros(self.n_lstm_layers, batch_size, self.lstm_hidden_size, device=obs.device)
-            c0 = torch.zeros(self.n_lstm_layers, batch_size, self.lstm_hidden_size, device=obs.device)
-            lstm_states = (h0, c0)
+            h, c = self.init_hidden(obs.shape[0], obs.device)
+        else:
+            h, c = lstm_states
+
+        if obs.dim() == 2:
+            logits, values, h, c = self.forward_step(obs, h, c)
+        elif lengths is not None and self.checkpoint_segments > 1:
+            logits, values, h, c = self.forward_checkpointed(obs, h, c)
+        elif lengths is not None:
+            logits, values, h, c = self.forward_packed(obs, lengths, h, c)
+        else:
+            logits, values, h, c = self.forward_seq(obs, h, c)
+        return logits, values, (h, c)
+
+    @torch.jit.export
+    def forward_step(
+        self, obs: torch.Tensor, h: torch.Tensor, c: torch.Tensor
+    ) -> tuple[list[torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Single timestep: obs (batch, obs_dim) -> logits (batch, head_dim) per head,
+        values (batch, 1) and the new (h, c).
+        """
+        features = self.features_extractor(obs).unsqueeze(1)  # (batch, 1, 64)
+        lstm_out, (h, c) = self.lstm(features, (h, c))
+        lstm_out = lstm_out.squeeze(1)  # (batch, hidden)
+
+        outputs = self.heads(lstm_out).split(self.head_sizes, dim=-1)
+        logits, values = list(outputs[:-1]), outputs[-1]
+        return logits, values, h, c
+
+    @torch.jit.export
+    def forward_seq(
+        self, obs: torch.Tensor, h: torch.Tensor, c: torch.Tensor
+    ) -> tuple[list[torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Sequence: obs (batch, seq_len, obs_dim) -> logits (batch, seq_len, head_dim)
+        per head, values (batch, seq_len, 1) and the new (h, c).
+        """
+        features = self.features_extractor(obs)  # (batch, seq_len, 64)
+        lstm_out, (h, c) = self.lstm(features, (h, c))  # (batch, seq_len, hidden)
 
-        # LSTM forward
-        lstm_out, lstm_states = self.lstm(features, lstm_states)  # (batch, seq_len, hidden)
+        outputs = self.heads(lstm_out).split(self.head_sizes, dim=-1)
+        logits, values = list(outputs[:-1]), outputs[-1]
+        return logits, values, h, c
 
-        # Policy heads (one per action head)
-        logits = [head(lstm_out) for head in self.policy_heads]
-        values = self.value_head(lstm_out)  # (batch, seq_len, 1)
+    @torch.jit.unused
+    def forward_packed(
+        self, obs: torch.Tensor, lengths: torch.Tensor, h: torch.Tensor, c: torch.Tensor
+    ) -> tuple[list[torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Padded sequences: obs (batch, seq_len, obs_dim) with per-sequence `lengths`.
+        The MLP and LSTM only see real steps; outputs past each length are padding.
+        """
+        packed = pack_padded_sequence(obs, lengths.cpu(), batch_first=True, enforce_sorted=False)
+        features = PackedSequence(
+            self.features_extractor(packed.data), packed.batch_sizes, packed.sorted_indices, packed.unsorted_indices
+        )
+        packed_out, (h, c) = self.lstm(features, (h, c))
+        lstm_out, _ = pad_packed_sequence(packed_out, batch_first=True, total_length=obs.shape[1])
 
-        if single_step:
-            logits = [l.squeeze(1) for l in logits]  # each: (batch, head_dim)
-            values = values.squeeze(1)  # (batch, 1)
+        outputs = self.heads(lstm_out).split(self.head_sizes, dim=-1)
+        logits, values = list(outputs[:-1]), outputs[-1]
+        return logits, values, h, c
 
-        return logits, values, lstm_states
+    @torch.jit.unused
+    def forward_checkpointed(
+        self, obs: torch.Tensor, h: torch.Tensor, c: torch.Tensor
+    ) -> tuple[list[torch.Tensor], torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Padded sequences with activation checkpointing: the MLP and LSTM run over
+        `checkpoint_segments` time chunks, keeping only each chunk's input and the
+        (h, c) at chunk boundaries for backward, which recomputes the chunk.
+        Padding is not skipped, so outputs past each length and the returned
+        (h, c) include the padded steps.
+        """
+        lstm_out = []
+        for chunk in obs.tensor_split(self.checkpoint_segments, dim=1):
+            chunk_out, h, c = checkpoint(self._features_lstm, chunk, h, c, use_reentrant=False)
+            lstm_out.append(chunk_out)
+
+        outputs = self.heads(torch.cat(lstm_out, dim=1)).split(self.head_sizes, dim=-1)
+        logits, values = list(outputs[:-1]), outputs[-1]
+        return logits, values, h, c
+
+    @torch.jit.unused
+    def _features_lstm(
+        self, obs: torch.Tensor, h: torch.Tensor, c: torch.Tensor
+    ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        lstm_out, (h, c) = self.lstm(self.features_extractor(obs), (h, c))
+        return lstm_out, h, c
 
     def get_action(
         self,
         obs: torch.Tensor,
         lstm_states: tuple[torch.Tensor, torch.Tensor] | None = None,
         deterministic: bool = True,
-    ) -> tuple[list[int], tuple[torch.Tensor, torch.Tensor]]:
-        """Get action as list of integers (one per head)."""
-        with torch.no_grad():
+    ) -> tuple[list[int], float, tuple[torch.Tensor, torch.Tensor]]:
+        """Get action as list of integers (one per head), the value estimate and new LSTM states."""
+        with torch.inference_mode():
             obs = obs.unsqueeze(0)  # (1, obs_dim)
-            logits_list, _, lstm_states = self.forward(obs, lstm_states)
+            logits_list, values, lstm_states = self.forward(obs, lstm_states)
+
+            heads = [logits.squeeze(0) for logits in logits_list]  # (head_dim,) each
+            if deterministic:
+                actions = torch.stack([logits.argmax() for logits in heads])
+            else:
+                actions = torch.cat([torch.multinomial(torch.softmax(logits, dim=-1), 1) for logits in heads])
 
-            actions = []
-            for logits in logits_list:
-                logits = logits.squeeze(0)  # (head_dim,)
-                if deterministic:
-                    action = logits.argmax().item()
-                else:
-                    probs = torch.softmax(logits, dim=-1)
-                    action = torch.multinomial(probs, 1).item()
-                actions.append(action)
+            # One device-to-host copy for every head's action and the value
+            *actions, value = torch.cat([actions.float(), values.view(1).float()]).tolist()
 
-        return actions, lstm_states
+        return [int(a) for a in actions], value, lstm_states
 
-    def init_hidden(self, batch_size: int = 1, device: torch.device = None) -> tuple[torch.Tensor, torch.Tensor]:
+    def init_hidden(
+        self, batch_size: int = 1, device: torch.device | None = None
+    ) -> tuple[torch.Tensor, torch.Tensor]:
         if device is None:
-            device = next(self.parameters()).device
+            device = self.heads.weight.device
+        dtype = self.heads.weight.dtype  # follows the model (e.g. bfloat16 inference)
 
-        h0 = torch.zeros(self.n_lstm_layers, batch_size, self.lstm_hidden_size, device=device)
-        c0 = torch.zeros(self.n_lstm_layers, batch_size, self.lstm_hidden_size, device=device)
+        h0 = torch.zeros(self.n_lstm_layers, batch_size, self.lstm_hidden_size, device=device, dtype=dtype)
+        c0 = torch.zeros(self.n_lstm_layers, batch_size, self.lstm_hidden_size, device=device, dtype=dtype)
         return (h0, c0)
@@ -1,27 +1,111 @@
 import asyncio
 import json
+from pathlib import Path
+
 import numpy as np
 import torch
-from websockets.asyncio.server import serve
 from sb3_contrib import RecurrentPPO
-from pathlib import Path
+from sb3_contrib.common.recurrent.type_aliases import RNNStates
+from websockets.asyncio.server import serve
 
-from jad import JadConfig, JadState, HealerState, Observation
-from jad.env import obs_to_array, get_normalize_mask, RunningNormalizer
+try:
+    import orjson
+except ImportError:  # Optional: stdlib json is used when orjson is not installed
+    orjson = None
+
+from jad import JadConfig
+from jad.env import RunningNormalizer, get_normalize_mask, get_observation_dim
+from jad.env.observations import (
+    JAD_CONTINUOUS_OFFSET,
+    JAD_PROJECTILE_DELAY,
+    MAX_COORD,
+    MAX_HEALER_HP,
+    MAX_JAD_HP,
+    MAX_MELEE_STAT,
+    MAX_PLAYER_HP,
+    MAX_PRAYER,
+    MAX_RANGED_STAT,
+    safe_divide,
+)
 from models import LSTMPolicy
 
+if orjson is not None:
+    _loads = orjson.loads
+
+    def _dumps(obj: dict) -> str:
+        # Decoded to str so replies stay text frames (the browser JSON.parses event.data)
+        return orjson.dumps(obj).decode()
+else:
+    _loads = json.loads
+    _dumps = json.dumps
+
+
+# Micro-batching: concurrent clients' steps within the window share one forward pass
+MAX_BATCH = 32
+BATCH_WINDOW = 0.002  # seconds, only waited for when several clients are connected
+
 
 class AgentServer:
     def __init__(self, checkpoint_path: str, jad_count: int = 1,
                  healers_per_jad: int = 3):
         self.model = None
-        self.lstm_state = None
         self.model_type = None  # "sb3" or "bc"
         self.device = None
+        self.dtype = torch.float32
         self.config = JadConfig(jad_count=jad_count, healers_per_jad=healers_per_jad)
 
         self._load_model(checkpoint_path)
 
+        # Observation rows reused across batches (consumed before the next batch is parsed).
+        # On CUDA they are a view of pinned host memory, so the H2D copy can run async.
+        obs_dim = get_observation_dim(self.config)
+        if self.device.type == "cuda":
+            self._obs_host = torch.empty(MAX_BATCH, obs_dim, dtype=torch.float32, pin_memory=True)
+            self._obs_dev = torch.empty(MAX_BATCH, obs_dim, dtype=self.dtype, device=self.device)
+            self._obs_buf = self._obs_host.numpy()
+        else:
+            self._obs_host = None
+            self._obs_buf = np.empty((MAX_BATCH, obs_dim), dtype=np.float32)
+
+        self._bc_graph = None
+        if self.model_type == "bc" and self.device.type == "cuda":
+            self._bc_graph = self._capture_bc_graph()
+
+        # Pending (obs_dict, state, future) steps from all connections; a single batcher
+        # task owns the model and runs each batch in a worker thread
+        self._requests: asyncio.Queue | None = None
+        self._num_clients = 0
+        # Dedicated stream keeps inference off the default CUDA stream
+        self._cuda_stream = torch.cuda.Stream(self.device) if self.device.type == "cuda" else None
+
+    def _capture_bc_graph(self) -> torch.cuda.CUDAGraph:
+        """
+        Record one batch=1 forward_step, including the in-place (h, c) update, as a CUDA
+        graph reading the first row of self._obs_dev. Replaying it is a single launch for
+        a batch of one (the common single-client case).
+        """
+        self._obs_dev.zero_()
+        obs = self._obs_dev[:1]
+
+        # Capture requires warm-up (cuDNN/cuBLAS workspace setup) on a side stream
+        side_stream = torch.cuda.Stream(self.device)
+        side_stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(side_stream), torch.inference_mode():
+            for _ in range(3):
+                self.model.forward_step(obs, self._h_buf, self._c_buf)
+        torch.cuda.current_stream(self.device).wait_stream(side_stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph), torch.inference_mode():
+            logits, values, hidden, cell = self.model.forward_step(obs, self._h_buf, self._c_buf)
+            self._h_buf.copy_(hidden)
+            self._c_buf.copy_(cell)
+
+        # Static outputs, overwritten by every replay
+        self._graph_logits = logits
+        self._graph_values = values
+        return graph
+
     def _load_model(self, checkpoint_path: str):
         path = Path(checkpoint_path)
 
@@ -36,13 +120,19 @@ class AgentServer:
         self.model_type = "sb3"
         self.model = RecurrentPPO.load(checkpoint_path, device="auto")
         self.device = self.model.device
-        self.lstm_state = None
+        self.model.policy.set_training_mode(False)
+
+        # Per-client recurrent state lives on the device between steps (predict() would
+        # round-trip it through numpy)
+        self._episode_starts = torch.zeros(MAX_BATCH, device=self.device)
         print(f"Loaded SB3 checkpoint: {checkpoint_path}")
 
         # Set up observation normalizer (matching SelectiveVecNormalize used in training)
         self.normalize_mask = get_normalize_mask(self.config)
         n_continuous = int(np.sum(self.normalize_mask))
         self.obs_normalizer = RunningNormalizer(shape=(n_continuous,))
+        # Continuous features come first in the layout, so a slice selects them as a view
+        self._norm_sel = slice(0, n_continuous)
 
         # Load normalizer stats saved by SelectiveVecNormalize during training
         checkpoint_dir = Path(checkpoint_path).parent
@@ -82,7 +172,29 @@ class AgentServer:
         self.model.load_state_dict(checkpoint["model_state_dict"])
         self.model.eval()
 
-        self.lstm_state = None
+        # bfloat16 halves the bytes moved per matmul and keeps fp32's range (no calibration)
+        self.dtype = torch.float32
+        if self.device.type == "cuda" and torch.cuda.is_bf16_supported():
+            self.dtype = torch.bfloat16
+            self.model = self.model.to(self.dtype)
+
+        if self.device.type == "cuda":
+            # Eager here; the whole batch=1 step is captured as a CUDA graph once the
+            # device obs buffer exists (see _capture_bc_graph)
+            self.policy_step = self.model.forward_step
+        else:
+            # Scripted forward shares parameters with self.model; scripting (not tracing)
+            # keeps the LSTM free of hard-coded batch/sequence sizes
+            self.policy_step = torch.jit.script(self.model).forward_step
+
+        # The first calls profile and fuse the scripted graph, so run them before serving
+        with torch.inference_mode():
+            warmup_obs = torch.zeros(1, config["obs_dim"], device=self.device, dtype=self.dtype)
+            for _ in range(3):
+                self.policy_step(warmup_obs, *self.model.init_hidden(1, self.device))
+
+        # Static (h, c) read and written by the batch=1 CUDA graph
+        self._h_buf, self._c_buf = self.model.init_hidden(1, self.device)
         print(f"Loaded BC checkpoint: {checkpoint_path}")
         print(f"  Action dims: {config['action_dims']}")
         print(f"  Loss: {checkpoint.get('loss', 'N/A'):.4f}, Accuracy: {checkpoint.get('accuracy', 'N/A'):.2%}")
@@ -91,145 +203,211 @@ class AgentServer:
         self.normalize_mask = None
         self.obs_normalizer = None
 
-    def _parse_observation(self, obs_dict: dict) -> Observation:
-        # Parse jads array
-        jads_data = obs_dict.get("jads", [])
-        jads = [
-            JadState(
-                hp=j.get("hp", 0),
-                attack=j.get("attack", 0),
-                ticks_until_impact=j.get("ticks_until_impact", 0),
-                x=j.get("x", 0),
-                y=j.get("y", 0),
-                alive=j.get("alive", False),
-            )
-            for j in jads_data
-        ]
+    def _parse_observation_to_array(self, obs_dict: dict, out: np.ndarray) -> np.ndarray:
+        """Encode an observation dict straight into `out`, same layout as obs_to_array."""
+        jad_count = self.config.jad_count
+        total_healers = jad_count * self.config.healers_per_jad
+        get = obs_dict.get
+
+        out.fill(0.0)
+
+        # Player continuous (9) + next projectile ticks (1)
+        out[:10] = (
+            get("player_hp", 99) / MAX_PLAYER_HP,
+            get("player_prayer", 99) / MAX_PRAYER,
+            get("player_ranged", 99) / MAX_RANGED_STAT,
+            get("player_defence", 99) / MAX_MELEE_STAT,
+            safe_divide(get("bastion_doses", 0), get("starting_bastion_doses", 4)),
+            safe_divide(get("sara_brew_doses", 0), get("starting_sara_brew_doses", 4)),
+            safe_divide(get("super_restore_doses", 0), get("starting_super_restore_doses", 4)),
+            get("player_location_x", 0) / MAX_COORD,
+            get("player_location_y", 0) / MAX_COORD,
+            get("next_projectile_ticks", 0) / JAD_PROJECTILE_DELAY,
+        )
 
-        # Parse healers array
-        healers_data = obs_dict.get("healers", [])
-        healers = [
-            HealerState(
-                hp=h.get("hp", 0),
-                x=h.get("x", 0),
-                y=h.get("y", 0),
-                target=h.get("target", 0),
+        # Jad continuous (hp, x, y, ticks_until_impact per Jad)
+        jads_data = get("jads", [])[:jad_count]
+        for j, jad in enumerate(jads_data):
+            o = JAD_CONTINUOUS_OFFSET + 4 * j
+            out[o:o + 4] = (
+                jad.get("hp", 0) / MAX_JAD_HP,
+                jad.get("x", 0) / MAX_COORD,
+                jad.get("y", 0) / MAX_COORD,
+                jad.get("ticks_until_impact", 0) / JAD_PROJECTILE_DELAY,
             )
-            for h in healers_data
-        ]
-
-        return Observation(
-            # Player state
-            player_hp=obs_dict.get("player_hp", 99),
-            player_prayer=obs_dict.get("player_prayer", 99),
-            player_ranged=obs_dict.get("player_ranged", 99),
-            player_defence=obs_dict.get("player_defence", 99),
-            player_location_x=obs_dict.get("player_location_x", 0),
-            player_location_y=obs_dict.get("player_location_y", 0),
-            player_target=obs_dict.get("player_target", 0),
-
-            # Prayer state
-            active_prayer=obs_dict.get("active_prayer", 0),
-            rigour_active=obs_dict.get("rigour_active", False),
-
-            # Inventory
-            bastion_doses=obs_dict.get("bastion_doses", 0),
-            sara_brew_doses=obs_dict.get("sara_brew_doses", 0),
-            super_restore_doses=obs_dict.get("super_restore_doses", 0),
-
-            # Dynamic Jad/healer state
-            jads=jads,
-            healers=healers,
-            healers_spawned=obs_dict.get("healers_spawned", False),
-
-            # Next projectile
-            next_projectile_type=obs_dict.get("next_projectile_type", 0),
-            next_projectile_ticks=obs_dict.get("next_projectile_ticks", 0),
-
-            # Starting doses for normalization
-            starting_bastion_doses=obs_dict.get("starting_bastion_doses", 4),
-            starting_sara_brew_doses=obs_dict.get("starting_sara_brew_doses", 4),
-            starting_super_restore_doses=obs_dict.get("starting_super_restore_doses", 4),
+        i = JAD_CONTINUOUS_OFFSET + 4 * jad_count
+
+        # Healer continuous (hp, x, y per healer)
+        healers_data = get("healers", [])[:total_healers]
+        for h, healer in enumerate(healers_data):
+            o = i + 3 * h
+            out[o:o + 3] = (
+                healer.get("hp", 0) / MAX_HEALER_HP,
+                healer.get("x", 0) / MAX_COORD,
+                healer.get("y", 0) / MAX_COORD,
+            )
+        i += 3 * total_healers
+
+        # One-hots: player target, active prayer, next projectile type
+        target_size = 1 + jad_count + total_healers
+        for value, size in (
+            (get("player_target", 0), target_size),
+            (get("active_prayer", 0), 4),
+            (get("next_projectile_type", 0), 4),
+        ):
+            if 0 <= value < size:
+                out[i + value] = 1.0
+            i += size
+
+        # Per-Jad attack and per-healer target one-hots
+        for j, jad in enumerate(jads_data):
+            attack = jad.get("attack", 0)
+            if 0 <= attack < 4:
+                out[i + 4 * j + attack] = 1.0
+        i += 4 * jad_count
+        for h, healer in enumerate(healers_data):
+            target = healer.get("target", 0)
+            if 0 <= target < 3:
+                out[i + 3 * h + target] = 1.0
+        i += 3 * total_healers
+
+        # Binary
+        out[i] = float(get("rigour_active", False))
+        out[i + 1] = float(get("healers_spawned", False))
+        return out
+
+    def initial_state(self) -> tuple[torch.Tensor, ...] | RNNStates:
+        """Zero recurrent state for one client (start of an episode)."""
+        if self.model_type == "bc":
+            return self.model.init_hidden(1, self.device)
+        shape = self.model.policy.lstm_hidden_state_shape
+        return RNNStates(
+            pi=(torch.zeros(shape, device=self.device), torch.zeros(shape, device=self.device)),
+            vf=(torch.zeros(shape, device=self.device), torch.zeros(shape, device=self.device)),
         )
 
-    def get_action(self, obs_dict: dict) -> tuple[list[int], float]:
-        obs = self._parse_observation(obs_dict)
-
-        # Convert to array
-        obs_array = obs_to_array(obs, self.config)
-
+    def get_actions(self, obs_dicts: list[dict], states: list) -> list[tuple[list[int], float, object]]:
+        """Run one batched forward for several clients: (action, value, new state) per client."""
+        n = len(obs_dicts)
+        # Straight to the reused rows, skipping the Observation dataclass
+        for i, obs_dict in enumerate(obs_dicts):
+            self._parse_observation_to_array(obs_dict, self._obs_buf[i])
+
+        if self._cuda_stream is not None:
+            with torch.cuda.stream(self._cuda_stream):
+                return self._predict(self._obs_buf[:n], states)
+        return self._predict(self._obs_buf[:n], states)
+
+    def _obs_tensor(self, obs_array: np.ndarray) -> torch.Tensor:
+        """(n, obs_dim) tensor of the parsed observation rows on the model device."""
+        if self._obs_host is None:
+            return torch.from_numpy(obs_array).to(self.device, dtype=self.dtype)
+        # obs_array is the pinned host buffer; the copy is ordered on the inference stream
+        n = len(obs_array)
+        self._obs_dev[:n].copy_(self._obs_host[:n], non_blocking=True)
+        return self._obs_dev[:n]
+
+    def _predict(self, obs_array: np.ndarray, states: list) -> list[tuple[list[int], float, object]]:
         if self.model_type == "sb3":
-            return self._get_action_sb3(obs_array)
+            return self._get_actions_sb3(obs_array, states)
         else:
-            return self._get_action_bc(obs_array)
-
-    def _get_action_sb3(self, obs_array: np.ndarray) -> tuple[list[int], float]:
-        # Normalize only continuous features (matching training)
-        result = obs_array.copy()
-        continuous = obs_array[self.normalize_mask]
-        normalized_continuous = self.obs_normalizer.normalize(continuous)
-        result[self.normalize_mask] = normalized_continuous
-        obs_array = result
-
-        # Get action from model - returns np.ndarray for MultiDiscrete
-        action, self.lstm_state = self.model.predict(
-            obs_array,
-            state=self.lstm_state,
-            deterministic=True,
-        )
-
-        # Try to get value estimate from the policy
-        value = 0.0
-        try:
-            if self.lstm_state is not None:
-                obs_tensor = torch.as_tensor(obs_array).float().unsqueeze(0).to(self.model.device)
-                hidden = torch.as_tensor(self.lstm_state[0][0]).unsqueeze(0).to(self.model.device)
-                cell = torch.as_tensor(self.lstm_state[1][0]).unsqueeze(0).to(self.model.device)
-                lstm_states = (hidden, cell)
-                episode_starts = torch.as_tensor([False]).float().to(self.model.device)
-                value = self.model.policy.predict_values(
-                    obs_tensor, lstm_states, episode_starts
-                )
-                value = float(value.item())
-        except Exception:
-            pass
-
-        # Convert numpy array to list for JSON serialization
-        return [int(a) for a in action], value
-
-    def _get_action_bc(self, obs_array: np.ndarray) -> tuple[list[int], float]:
-        # BC models use obs_to_array which already normalizes
-        obs_tensor = torch.from_numpy(obs_array).float().to(self.device)
-
-        # get_action returns list of ints (one per head)
-        action, self.lstm_state = self.model.get_action(
-            obs_tensor,
-            lstm_states=self.lstm_state,
-            deterministic=True,
+            return self._get_actions_bc(obs_array, states)
+
+    def _get_actions_sb3(self, obs_array: np.ndarray, states: list[RNNStates]) -> list[tuple[list[int], float, object]]:
+        n = len(obs_array)
+        # Normalize only continuous features (matching training), in place in the obs buffer
+        continuous = obs_array[:, self._norm_sel]
+        self.obs_normalizer.normalize(continuous, out=continuous)
+        obs_tensor = self._obs_tensor(obs_array)
+
+        # Clients' states stacked along the batch dim of (n_layers, batch, hidden)
+        lstm_states = RNNStates(
+            pi=tuple(torch.cat([state.pi[k] for state in states], dim=1) for k in range(2)),
+            vf=tuple(torch.cat([state.vf[k] for state in states], dim=1) for k in range(2)),
         )
 
-        # Get value estimate
-        value = 0.0
-        try:
-            with torch.no_grad():
-                obs_batch = obs_tensor.unsqueeze(0)
-                _, values, _ = self.model(obs_batch, self.lstm_state)
-                value = float(values.squeeze().item())
-        except Exception:
-            pass
+        # One policy forward gives both the greedy actions and the value estimates
+        with torch.inference_mode():
+            actions, values, _, new = self.model.policy(
+                obs_tensor, lstm_states, self._episode_starts[:n], deterministic=True
+            )
 
-        return action, value
+        new_states = [
+            RNNStates(
+                pi=(new.pi[0][:, i:i + 1], new.pi[1][:, i:i + 1]),
+                vf=(new.vf[0][:, i:i + 1], new.vf[1][:, i:i + 1]),
+            )
+            for i in range(n)
+        ]
+        # Convert to Python ints/floats for JSON serialization
+        return list(zip(actions.tolist(), values.squeeze(1).tolist(), new_states))
 
-    def reset_state(self):
-        self.lstm_state = None
+    def _get_actions_bc(self, obs_array: np.ndarray, states: list[tuple]) -> list[tuple[list[int], float, object]]:
+        # BC models use obs_to_array which already normalizes
+        n = len(obs_array)
+        obs_tensor = self._obs_tensor(obs_array)
+
+        # One forward gives both the greedy actions and the value estimates
+        if self._bc_graph is not None and n == 1:
+            self._h_buf.copy_(states[0][0])
+            self._c_buf.copy_(states[0][1])
+            self._bc_graph.replay()
+            logits_list, values = self._graph_logits, self._graph_values
+            hidden, cell = self._h_buf.clone(), self._c_buf.clone()
+        else:
+            hidden = torch.cat([state[0] for state in states], dim=1)
+            cell = torch.cat([state[1] for state in states], dim=1)
+            with torch.inference_mode():
+                logits_list, values, hidden, cell = self.policy_step(obs_tensor, hidden, cell)
+
+        actions = torch.stack([logits.argmax(dim=-1) for logits in logits_list], dim=1).tolist()
+        values = values.squeeze(1).float().tolist()
+        new_states = [(hidden[:, i:i + 1], cell[:, i:i + 1]) for i in range(n)]
+        return list(zip(actions, values, new_states))
+
+    async def _batch_worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._requests.get()]
+
+            # With several clients connected, give their steps a short window to join
+            deadline = loop.time() + (BATCH_WINDOW if self._num_clients > 1 else 0.0)
+            while len(requests) < MAX_BATCH:
+                if not self._requests.empty():
+                    requests.append(self._requests.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(self._requests.get(), timeout))
+                except TimeoutError:
+                    break
+
+            obs_dicts, states, futures = zip(*requests)
+            try:
+                # Off the event loop so websocket I/O keeps flowing during the forward
+                results = await asyncio.to_thread(self.get_actions, list(obs_dicts), list(states))
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            # A client that disconnected mid-batch has cancelled its future
+            for future, result in zip(futures, results):
+                if not future.done():
+                    future.set_result(result)
 
     async def handle_connection(self, websocket):
         print("Browser connected!")
+        self._num_clients += 1
+        loop = asyncio.get_running_loop()
+        state = self.initial_state()
 
         try:
             async for message in websocket:
                 try:
-                    data = json.loads(message)
+                    data = _loads(message)
 
                     if data.get("type") == "step":
                         obs_dict = data.get("observation", {})
@@ -237,29 +415,37 @@ class AgentServer:
 
                         if terminated:
                             print("Episode ended")
-                            self.reset_state()
+                            state = self.initial_state()
                         else:
-                            action, value = self.get_action(obs_dict)
-                            await websocket.send(json.dumps({"action": action, "value": value}))
+                            future = loop.create_future()
+                            await self._requests.put((obs_dict, state, future))
+                            action, value, state = await future
+                            await websocket.send(_dumps({"action": action, "value": value}))
 
                     elif data.get("type") == "reset":
                         print("Episode reset")
-                        self.reset_state()
+                        state = self.initial_state()
 
-                except json.JSONDecodeError:
+                except json.JSONDecodeError:  # orjson.JSONDecodeError subclasses this
                     print(f"Invalid JSON: {message}")
 
         except Exception as e:
             print(f"Connection error: {e}")
         finally:
+            self._num_clients -= 1
             print("Browser disconnected")
 
     async def start(self, host: str = "localhost", port: int = 8765):
         print(f"Starting agent server on ws://{host}:{port}")
         print("Waiting for browser connection...")
 
-        async with serve(self.handle_connection, host, port):
-            await asyncio.get_running_loop().create_future()  # Run forever
+        self._requests = asyncio.Queue()
+        batcher = asyncio.create_task(self._batch_worker())
+        try:
+            async with serve(self.handle_connection, host, port):
+                await asyncio.get_running_loop().create_future()  # Run forever
+        finally:
+            batcher.cancel()
 
 
 async def main():
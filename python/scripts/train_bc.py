@@ -1,10 +1,12 @@
 import argparse
+import os
 import time
+from collections.abc import Iterator
 from pathlib import Path
 
 import torch
-import torch.nn as nn
-from torch.utils.data import DataLoader
+import torch.nn.functional as F
+from torch.utils.data import DataLoader, Dataset, TensorDataset
 
 from jad import JadConfig, get_action_dims
 from jad.env import get_observation_dim
@@ -12,6 +14,55 @@ from data import BCSequenceDataset, load_episodes
 from models import LSTMPolicy
 
 
+Batch = tuple[torch.Tensor, torch.Tensor, torch.Tensor]
+
+
+def stack_dataset(dataset: Dataset) -> Batch:
+    """Stack every padded (obs, actions, mask) sample once into (obs, actions, lengths) tensors."""
+    obs, actions, mask = (torch.stack(column) for column in zip(*(dataset[i] for i in range(len(dataset)))))
+    # Episodes are padded at the end, so the mask gives each sequence's length
+    lengths = mask.sum(dim=1).long()
+    return obs.float(), actions.long(), lengths
+
+
+def preload_dataset(dataset: Dataset, device: torch.device) -> Batch:
+    """Stack every sample onto `device` once; lengths stay on the CPU."""
+    obs, actions, lengths = stack_dataset(dataset)
+    return obs.to(device), actions.to(device), lengths
+
+
+def iterate_preloaded(tensors: Batch, batch_size: int) -> Iterator[Batch]:
+    """Shuffled (obs, actions, lengths) minibatches of preloaded tensors."""
+    obs, actions, lengths = tensors
+    perm = torch.randperm(len(lengths))
+    perm_device = perm.to(obs.device)
+    for start in range(0, len(perm), batch_size):
+        idx = perm_device[start:start + batch_size]
+        yield obs[idx], actions[idx], lengths[perm[start:start + batch_size]]
+
+
+def collate_flat(samples: list[tuple[torch.Tensor, ...]]) -> tuple[torch.Tensor, torch.Size, torch.Size, torch.Tensor]:
+    """
+    Collate stacked (obs, actions, length) samples into one flat byte buffer holding
+    the int64 actions followed by the float32 obs, so a batch reaches the device in
+    a single copy. Returns (buffer, actions shape, obs shape, lengths).
+    """
+    obs, actions, lengths = (torch.stack(column) for column in zip(*samples))
+    # Actions first: both parts then start at offsets aligned for their dtype
+    flat = torch.cat([actions.view(-1).view(torch.uint8), obs.view(-1).view(torch.uint8)])
+    return flat, actions.shape, obs.shape, lengths
+
+
+def iterate_loader(dataloader: DataLoader, device: torch.device) -> Iterator[Batch]:
+    """(obs, actions, lengths) minibatches from a DataLoader using collate_flat, moved to `device`."""
+    for flat, actions_shape, obs_shape, lengths in dataloader:
+        flat = flat.to(device, non_blocking=True)
+        split = actions_shape.numel() * 8
+        actions = flat[:split].view(torch.int64).view(actions_shape)
+        obs = flat[split:].view(torch.float32).view(obs_shape)
+        yield obs, actions, lengths
+
+
 def train(
     data_dir: str = "data",
     jad_count: int = 1,
@@ -23,8 +74,15 @@ def train(
     batch_size: int = 4,
     checkpoint_dir: str = "checkpoints",
     device: str = "auto",
+    num_workers: int | None = None,
+    preload: bool = True,
+    grad_accum_steps: int = 1,
+    checkpoint_segments: int = 1,
 ):
     """Train LSTM policy via behavioral cloning"""
+    if grad_accum_steps < 1:
+        raise ValueError(f"grad_accum_steps must be >= 1, got {grad_accum_steps}")
+
     # Setup device
     if device == "auto":
         device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -53,9 +111,34 @@ def train(
     total_steps = sum(len(obs) for obs, _ in episodes)
     print(f"Total steps: {total_steps}")
 
-    # Create dataset and dataloader
+    # Create dataset and batch source
     dataset = BCSequenceDataset(episodes)
-    dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=True)
+    if preload and device.type == "cuda":
+        # The episodes are small: copy them to the GPU once instead of every batch
+        preloaded = preload_dataset(dataset, device)
+
+        def batches() -> Iterator[Batch]:
+            return iterate_preloaded(preloaded, batch_size)
+    else:
+        # Background workers collate batches while the model trains; each batch is
+        # one pinned buffer, so its H2D copy is a single non_blocking transfer
+        if num_workers is None:
+            num_workers = min(max((os.cpu_count() or 1) - 2, 0), 8)
+        # Samples are views into tensors stacked once up front, so workers don't
+        # pad and allocate every episode again each epoch
+        dataloader = DataLoader(
+            TensorDataset(*stack_dataset(dataset)),
+            batch_size=batch_size,
+            shuffle=True,
+            num_workers=num_workers,
+            pin_memory=device.type == "cuda",
+            persistent_workers=num_workers > 0,
+            prefetch_factor=2 if num_workers > 0 else None,
+            collate_fn=collate_flat,
+        )
+
+        def batches() -> Iterator[Batch]:
+            return iterate_loader(dataloader, device)
     print(f"Max sequence length: {dataset.max_seq_len}")
 
     # Create model
@@ -64,6 +147,7 @@ def train(
         action_dims=action_dims,
         lstm_hidden_size=lstm_hidden_size,
         n_lstm_layers=n_lstm_layers,
+        checkpoint_segments=checkpoint_segments,
     ).to(device)
 
     num_heads = len(action_dims)
@@ -76,9 +160,35 @@ def train(
     total_params = sum(p.numel() for p in model.parameters())
     print(f"  Total parameters: {total_params:,}")
 
-    # Optimizer and loss
-    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate)
-    criterion = nn.CrossEntropyLoss(reduction='none')
+    # Compile on CUDA to fuse the feature MLP and head projections around the cuDNN
+    # LSTM. Compiled in place so state_dict keys are unchanged; the first batches pay
+    # a one-time compile cost (~20s). Packed lengths vary per batch, hence dynamic shapes.
+    if device.type == "cuda":
+        model.compile(dynamic=True)
+
+    # Optimizer (fused: one kernel per step for all parameters on CUDA)
+    optimizer = torch.optim.Adam(model.parameters(), lr=learning_rate, fused=device.type == "cuda")
+
+    # Mixed precision on CUDA: bf16 where supported (no loss scaling needed),
+    # otherwise fp16 with a GradScaler. CPU training stays fp32.
+    use_amp = device.type == "cuda"
+    amp_dtype = torch.bfloat16 if use_amp and torch.cuda.is_bf16_supported() else torch.float16
+    scaler = torch.amp.GradScaler("cuda", enabled=use_amp and amp_dtype == torch.float16)
+
+    # Column of the concatenated head logits behind each (head, action) slot; slots
+    # past a head's size point at a trailing -inf padding column
+    max_head_dim = max(action_dims)
+    pad_column = sum(action_dims)
+    offsets = [sum(action_dims[:h]) for h in range(num_heads)]
+    head_index = torch.tensor(
+        [offsets[h] + a if a < dim else pad_column for h, dim in enumerate(action_dims) for a in range(max_head_dim)],
+        device=device,
+    )
+
+    def optimizer_step() -> None:
+        scaler.step(optimizer)
+        scaler.update()
+        optimizer.zero_grad()
 
     # Create checkpoint directory
     checkpoint_path = Path(checkpoint_dir)
@@ -92,53 +202,65 @@ def train(
 
     for epoch in range(epochs):
         model.train()
-        epoch_loss = 0.0
-        epoch_correct = 0
-        epoch_total = 0
-
-        for batch_obs, batch_actions, batch_mask in dataloader:
-            batch_obs = batch_obs.to(device)
-            batch_actions = batch_actions.to(device)  # (batch, seq_len, num_heads)
-            batch_mask = batch_mask.to(device)
-
-            # Forward pass - logits_list is list of (batch, seq_len, head_dim)
-            logits_list, _, _ = model(batch_obs)
-
-            # Compute loss for each head and sum
-            total_loss = 0.0
-            total_correct = 0
-            mask_flat = batch_mask.view(-1)  # (batch * seq_len,)
-
-            for head_idx, logits in enumerate(logits_list):
-                head_dim = action_dims[head_idx]
-                logits_flat = logits.view(-1, head_dim)  # (batch * seq_len, head_dim)
-                actions_flat = batch_actions[:, :, head_idx].reshape(-1)  # (batch * seq_len,)
-
-                loss_per_step = criterion(logits_flat, actions_flat)
-                head_loss = (loss_per_step * mask_flat).sum() / mask_flat.sum()
-                total_loss = total_loss + head_loss
-
-                # Track accuracy per head
-                preds = logits_flat.argmax(dim=-1)
-                correct = ((preds == actions_flat) * mask_flat).sum().item()
-                total_correct += correct
-
-            # Average loss across heads
-            loss = total_loss / num_heads
-
-            # Backward pass
-            optimizer.zero_grad()
-            loss.backward()
-            optimizer.step()
+        # Metrics accumulate on the device and are read back once per epoch,
+        # so batches don't each force a host sync
+        epoch_loss = torch.zeros((), dtype=torch.float64, device=device)
+        epoch_correct = torch.zeros((), dtype=torch.float64, device=device)
+        epoch_total = torch.zeros((), dtype=torch.float64, device=device)
+
+        # batch_actions: (batch, seq_len, num_heads); batch_lengths stays on the CPU for packing
+        accumulated = 0
+        for batch_obs, batch_actions, batch_lengths in batches():
+            # Forward pass - logits_list is list of (batch, seq_len, head_dim).
+            # Packed by length so the LSTM skips the padding.
+            with torch.autocast(device.type, dtype=amp_dtype, enabled=use_amp):
+                logits_list, _, _ = model(batch_obs, lengths=batch_lengths)
+
+            # Only real (unpadded) steps enter the loss: gather them once for all heads.
+            # Episodes are padded at the end, so the valid indices and their count come
+            # from the CPU-side lengths instead of a nonzero() that syncs with the device
+            step_ids = torch.arange(batch_obs.shape[1])
+            valid = (step_ids < batch_lengths.unsqueeze(1)).view(-1).nonzero().squeeze(1)  # (n_valid,)
+            mask_count = valid.numel()
+            valid = valid.to(device, non_blocking=True)
+            actions_valid = batch_actions.reshape(-1, num_heads).index_select(0, valid)  # (n_valid, num_heads)
+
+            # Lay the heads side by side, padded with -inf to the widest head, so one
+            # cross_entropy covers every head: (n_valid, max_head_dim, num_heads)
+            logits_flat = torch.cat(logits_list, dim=-1).view(-1, pad_column).index_select(0, valid)
+            logits_flat = F.pad(logits_flat.float(), (0, 1), value=float("-inf"))  # loss in fp32
+            logits_valid = logits_flat[:, head_index].view(-1, num_heads, max_head_dim).transpose(1, 2)
+
+            # Every head has mask_count targets, so the mean over all of them is the
+            # average of the per-head losses
+            loss = F.cross_entropy(logits_valid, actions_valid)
+
+            # Track accuracy (summed over heads)
+            epoch_correct += (logits_valid.argmax(dim=1) == actions_valid).sum()
+
+            # Backward pass; gradients of grad_accum_steps batches add up before each step
+            scaler.scale(loss / grad_accum_steps).backward()
+            accumulated += 1
+            if accumulated == grad_accum_steps:
+                optimizer_step()
+                accumulated = 0
 
             # Track metrics (accuracy is average across all heads)
-            epoch_loss += loss.item() * mask_flat.sum().item()
-            epoch_correct += total_correct
-            epoch_total += mask_flat.sum().item() * num_heads
+            epoch_loss += loss.detach() * mask_count
+            epoch_total += mask_count * num_heads
+
+        # Don't drop the gradients of a trailing partial accumulation. Its batches were
+        # also divided by grad_accum_steps, so rescale them to a full step's weight
+        if accumulated > 0:
+            for param in model.parameters():
+                if param.grad is not None:
+                    param.grad.mul_(grad_accum_steps / accumulated)
+            optimizer_step()
 
         # Epoch stats
-        avg_loss = epoch_loss / epoch_total
-        accuracy = epoch_correct / epoch_total
+        epoch_total = epoch_total.item()
+        avg_loss = epoch_loss.item() / epoch_total
+        accuracy = epoch_correct.item() / epoch_total
 
         elapsed = time.time() - start_time
         elapsed_str = f"{int(elapsed // 60):02d}:{int(elapsed % 60):02d}"
@@ -152,7 +274,7 @@ def train(
                 'model_state_dict': model.state_dict(),
                 'config': {
                     'obs_dim': obs_dim,
-                    'action_dims': action_dims,
+                    'action_dims': list(action_dims),
                     'lstm_hidden_size': lstm_hidden_size,
                     'n_lstm_layers': n_lstm_layers,
                 },
@@ -228,7 +350,32 @@ def main():
         choices=["auto", "cuda", "cpu"],
         help="Device to train on (default: auto)",
     )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=None,
+        help="DataLoader worker processes (default: CPU cores - 2, at most 8)",
+    )
+    parser.add_argument(
+        "--no-preload",
+        action="store_true",
+        help="Stream batches through a DataLoader instead of preloading the dataset onto the GPU",
+    )
+    parser.add_argument(
+        "--grad-accum-steps",
+        type=int,
+        default=1,
+        help="Batches whose gradients are accumulated per optimizer step (default: 1)",
+    )
+    parser.add_argument(
+        "--checkpoint-segments",
+        type=int,
+        default=1,
+        help="Time chunks for LSTM activation checkpointing; trades recompute for memory (default: 1 = off)",
+    )
     args = parser.parse_args()
+    if args.grad_accum_steps < 1:
+        parser.error(f"--grad-accum-steps must be >= 1, got {args.grad_accum_steps}")
 
     train(
         data_dir=args.data_dir,
@@ -240,6 +387,10 @@ def main():
         batch_size=args.batch_size,
         checkpoint_dir=args.checkpoint_dir,
         device=args.device,
+        num_workers=args.num_workers,
+        preload=not args.no_preload,
+        grad_accum_steps=args.grad_accum_steps,
+        checkpoint_segments=args.checkpoint_segments,
     )
 
 
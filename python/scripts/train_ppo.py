@@ -2,17 +2,20 @@ import argparse
 import time
 from pathlib import Path
 
+import numpy as np
+import torch
 from sb3_contrib import RecurrentPPO
-from stable_baselines3.common.vec_env import DummyVecEnv
 from stable_baselines3.common.callbacks import BaseCallback
 from torch.utils.tensorboard import SummaryWriter
 
 from jad import JadConfig, get_action_dims
-from jad.env import make_jad_env, get_observation_dim, SelectiveVecNormalize
+from jad.env import (
+    VEC_ENV_TYPES, RewardFunc, default_vec_env, make_vec_jad_env, get_observation_dim, SelectiveVecNormalize,
+)
 
 
-# Available reward functions (defined in TypeScript src/core/rewards.ts)
-REWARD_FUNCTIONS = ['sparse', 'jad1', 'jad2', 'jad3']
+# Available reward functions (defined in TypeScript src/core/reward)
+REWARD_FUNCTIONS = [member.name.lower() for member in RewardFunc]
 
 
 class EpisodeStatsCallback(BaseCallback):
@@ -49,24 +52,20 @@ class EpisodeStatsCallback(BaseCallback):
         self.ent_coef_end = ent_coef_end
         self.ent_anneal_steps = ent_anneal_steps
 
-        # TensorBoard writer
-        self.tb_writer = SummaryWriter(tensorboard_log) if tensorboard_log else None
-
-        # Track stats for current block of episodes
-        self.episode_raw_rewards = []
-        self.episode_norm_rewards = []
-        self.episode_lengths = []
-        self.episode_wins = []
-        self.episode_jad_kills = []
+        # TensorBoard writer, created at the first log so runs stopped before then
+        # leave no event file. Forced flushes happen every tb_flush_every log
+        # intervals; the writer also flushes itself in the background and on close
+        self.tensorboard_log = tensorboard_log
+        self.tb_writer = None
+        self.tb_flush_every = 10
+
+        # Stats for the current block of episodes, one slot per episode. Stats are
+        # logged every log_interval episodes, so each block fills the buffers exactly.
+        self.episode_raw_rewards = np.zeros(log_interval, dtype=np.float64)
+        self.episode_lengths = np.zeros(log_interval, dtype=np.int64)
+        self.episode_jad_kills = np.zeros(log_interval, dtype=np.int64)
         self.total_episodes = 0
 
-        # Track jads killed per episode in current block
-        # jads_killed_counts[i] = number of episodes where exactly i jads were killed
-        self.jads_killed_counts = [0] * (jad_count + 1)
-
-        # Track per-env normalized reward accumulation
-        self.current_norm_rewards = [0.0] * num_envs
-
         # Time tracking
         self.start_time = time.time()
 
@@ -76,61 +75,42 @@ class EpisodeStatsCallback(BaseCallback):
             progress = min(1.0, self.num_timesteps / self.ent_anneal_steps)
             self.model.ent_coef = self.ent_coef_start + (self.ent_coef_end - self.ent_coef_start) * progress
 
-        # Accumulate normalized rewards per env
-        rewards = self.locals.get("rewards", [])
-        for i, r in enumerate(rewards):
-            self.current_norm_rewards[i] += r
-
         # Track episode stats from VecEnv infos
         infos = self.locals.get("infos", [])
-        dones = self.locals.get("dones", [])
-        for i, info in enumerate(infos):
+        for info in infos:
             if "episode" in info:
-                # Raw reward from Monitor wrapper
-                self.episode_raw_rewards.append(info["episode"]["r"])
-                # Normalized reward we accumulated
-                self.episode_norm_rewards.append(self.current_norm_rewards[i])
-                self.episode_lengths.append(info["episode"]["l"])
+                slot = self.total_episodes % self.log_interval
+                # Raw reward and length from Monitor wrapper
+                self.episode_raw_rewards[slot] = info["episode"]["r"]
+                self.episode_lengths[slot] = info["episode"]["l"]
+                # Jads killed from our custom info
+                self.episode_jad_kills[slot] = info.get("jads_killed", 0)
                 self.total_episodes += 1
 
-                # Track jads killed from our custom info
-                jads_killed = info.get("jads_killed", 0)
-                if jads_killed <= self.jad_count:
-                    self.jads_killed_counts[jads_killed] += 1
-
-                # Track wins and jad kills
-                is_win = 1 if jads_killed == self.jad_count else 0
-                self.episode_wins.append(is_win)
-                self.episode_jad_kills.append(jads_killed)
-
                 # Check if we should log (every log_interval episodes)
                 if self.total_episodes % self.log_interval == 0:
                     self._log_stats()
 
-            # Reset normalized reward accumulator when episode ends
-            if dones[i] if i < len(dones) else False:
-                self.current_norm_rewards[i] = 0.0
-
         return True
 
     def _log_stats(self):
         """Log stats for the last block of episodes."""
-        if len(self.episode_raw_rewards) == 0:
+        if self.total_episodes == 0:
             return
 
         # Calculate stats for the last log_interval episodes
-        recent_raw = self.episode_raw_rewards[-self.log_interval :]
-        recent_len = self.episode_lengths[-self.log_interval :]
-        recent_jad_kills = self.episode_jad_kills[-self.log_interval :]
+        recent_raw = self.episode_raw_rewards
+        recent_len = self.episode_lengths
+        recent_jad_kills = self.episode_jad_kills
 
-        mean_raw_reward = sum(recent_raw) / len(recent_raw)
-        mean_length = sum(recent_len) / len(recent_len)
-        min_raw, max_raw = min(recent_raw), max(recent_raw)
-        min_len, max_len = int(min(recent_len)), int(max(recent_len))
+        mean_raw_reward = float(recent_raw.mean())
+        mean_length = float(recent_len.mean())
+        min_raw, max_raw = float(recent_raw.min()), float(recent_raw.max())
+        min_len, max_len = int(recent_len.min()), int(recent_len.max())
 
         # Jad kills stats
-        mean_jad_kills = sum(recent_jad_kills) / len(recent_jad_kills)
-        min_jad_kills, max_jad_kills = min(recent_jad_kills), max(recent_jad_kills)
+        mean_jad_kills = float(recent_jad_kills.mean())
+        min_jad_kills, max_jad_kills = int(recent_jad_kills.min()), int(recent_jad_kills.max())
 
         # Calculate time
         elapsed = int(time.time() - self.start_time)
@@ -138,8 +118,8 @@ class EpisodeStatsCallback(BaseCallback):
         start_ep = self.total_episodes - self.log_interval + 1
 
         # Build jads killed summary
-        wins = self.jads_killed_counts[self.jad_count]  # All jads killed = win
-        total_jads_killed = sum(i * count for i, count in enumerate(self.jads_killed_counts))
+        wins = int(np.count_nonzero(recent_jad_kills == self.jad_count))  # All jads killed = win
+        total_jads_killed = int(recent_jad_kills.sum())
         max_possible_kills = self.log_interval * self.jad_count
 
         # Print multi-line stats
@@ -150,37 +130,34 @@ class EpisodeStatsCallback(BaseCallback):
         ent_str = f"  |  ent_coef: {self.model.ent_coef:.4f}" if self.ent_anneal_steps > 0 else ""
         print(f"  Steps:   {self.num_timesteps:,}  |  Time: {elapsed_str}{ent_str}")
 
-        # Log to TensorBoard (grouped metrics appear on same plot)
+        if self.tb_writer is None and self.tensorboard_log:
+            self.tb_writer = SummaryWriter(self.tensorboard_log)
+
+        # Log to TensorBoard. One add_scalar per metric keeps everything in the main
+        # event file (add_scalars opens a writer per sub-tag); the "group/" prefixes
+        # still group them into sections
         if self.tb_writer:
-            self.tb_writer.add_scalars("reward", {
-                "min": min_raw,
-                "avg": mean_raw_reward,
-                "max": max_raw,
-            }, self.total_episodes)
-
-            self.tb_writer.add_scalars("episode_length", {
-                "min": min_len,
-                "avg": mean_length,
-                "max": max_len,
-            }, self.total_episodes)
-
-            self.tb_writer.add_scalars("jad_kills", {
-                "min": min_jad_kills,
-                "avg": mean_jad_kills,
-                "max": max_jad_kills,
-            }, self.total_episodes)
-
-            self.tb_writer.add_scalar("win_rate", wins / self.log_interval, self.total_episodes)
+            step = self.total_episodes
+            for group, stats in (
+                ("reward", (min_raw, mean_raw_reward, max_raw)),
+                ("episode_length", (min_len, mean_length, max_len)),
+                ("jad_kills", (min_jad_kills, mean_jad_kills, max_jad_kills)),
+            ):
+                for name, value in zip(("min", "avg", "max"), stats):
+                    self.tb_writer.add_scalar(f"{group}/{name}", value, step)
+
+            self.tb_writer.add_scalar("win_rate", wins / self.log_interval, step)
 
             if self.ent_anneal_steps > 0:
-                self.tb_writer.add_scalar("ent_coef", self.model.ent_coef, self.total_episodes)
+                self.tb_writer.add_scalar("ent_coef", self.model.ent_coef, step)
 
             # Log summary stats as text (viewable in Text tab)
             self.tb_writer.add_text("progress",
                 f"**Episodes:** {self.total_episodes:,} | **Steps:** {self.num_timesteps:,}",
-                self.total_episodes)
+                step)
 
-            self.tb_writer.flush()
+            if (self.total_episodes // self.log_interval) % self.tb_flush_every == 0:
+                self.tb_writer.flush()
 
         # Save if this is the best so far (using raw reward for interpretability)
         if mean_raw_reward > self.best_mean_reward:
@@ -192,13 +169,12 @@ class EpisodeStatsCallback(BaseCallback):
 
         print()
 
-        # Reset jads killed counts for next block
-        self.jads_killed_counts = [0] * (self.jad_count + 1)
-
-    def _on_training_end(self) -> None:
-        """Close TensorBoard writer when training ends."""
+    def close(self) -> None:
+        """Flush and close the TensorBoard writer (also on interrupted runs)."""
         if self.tb_writer:
             self.tb_writer.close()
+            self.tb_writer = None
+            self.tb_writer = None
 
 
 def train(
@@ -223,6 +199,8 @@ def train(
     resume_path: str | None = None,
     reward_func: str | None = None,
     tensorboard_log: str | None = "runs",
+    vec_env: str | None = None,
+    env_workers: int | None = None,
 ):
     """
     Train using Stable-Baselines3 PPO with LSTM policy and parallelized environments.
@@ -249,6 +227,8 @@ def train(
         resume_path: Path to .zip checkpoint to resume training from
         reward_func: Reward function to use (None = auto based on jad_count)
         tensorboard_log: Directory for TensorBoard logs (None to disable)
+        vec_env: Vectorized env backend, 'dummy', 'subproc' or 'batched' (None = subproc for 4+ envs)
+        env_workers: Node processes the batched env is split across (None = one per CPU core, at most num_envs)
     """
     # Auto-select reward function based on jad count if not explicitly set.
     if reward_func is None:
@@ -268,6 +248,10 @@ def train(
     if ent_coef_end is None and ent_anneal_steps > 0:
         ent_coef_end = 0.005
 
+    # Let fp32 matmuls use TF32 tensor cores on Ampere+ GPUs (no effect on CPU);
+    # the LSTM itself goes through cuDNN, which already allows TF32
+    torch.set_float32_matmul_precision("high")
+
     # Create config
     config = JadConfig(jad_count=jad_count, healers_per_jad=healers_per_jad)
     obs_dim = get_observation_dim(config)
@@ -287,11 +271,12 @@ def train(
     normalizer_path = checkpoint_path / f"normalizer_sb3_{jad_count}jad_{healers_per_jad}heal.npz"
 
     # Create vectorized environments
-    print(f"Creating {num_envs} parallel environments...")
-
-    # Note: DummyVecEnv is often faster than SubprocVecEnv for fast environments
-    # because it avoids inter-process communication overhead.
-    venv = DummyVecEnv([make_jad_env(config, reward_func=reward_func) for _ in range(num_envs)])
+    if vec_env is None:
+        vec_env = default_vec_env(num_envs)
+    print(f"Creating {num_envs} parallel environments ({vec_env})...")
+    venv = make_vec_jad_env(
+        config, n_envs=num_envs, reward_func=reward_func, vec_env=vec_env, n_workers=env_workers
+    )
 
     # Wrap with SelectiveVecNormalize for shared observation normalization
     # This normalizes only continuous features, leaving one-hot encodings unchanged
@@ -384,6 +369,8 @@ def train(
         )
     except KeyboardInterrupt:
         print("\nTraining interrupted by user")
+    finally:
+        callback.close()
 
     env.close()
     return model
@@ -476,6 +463,19 @@ def main():
         default="runs",
         help="Directory for TensorBoard logs (default: runs, use 'none' to disable)",
     )
+    parser.add_argument(
+        "--vec-env",
+        type=str,
+        default=None,
+        choices=VEC_ENV_TYPES,
+        help="Vectorized env backend (default: subproc for 4+ envs, else dummy)",
+    )
+    parser.add_argument(
+        "--env-workers",
+        type=int,
+        default=None,
+        help="Node processes for --vec-env batched (default: one per CPU core, at most --num-envs)",
+    )
     args = parser.parse_args()
 
     tb_log = args.tensorboard_log if args.tensorboard_log.lower() != "none" else None
@@ -494,6 +494,8 @@ def main():
         resume_path=args.resume,
         reward_func=args.reward_func,
         tensorboard_log=tb_log,
+        vec_env=args.vec_env,
+        env_workers=args.env_workers,
     )
 
 
@@ -0,0 +1,141 @@
+"""BatchedJadVecEnv over a scripted stand-in for the Node process wrapper."""
+import numpy as np
+import pytest
+
+from jad import JadConfig
+from jad.actions import get_action_dims
+from jad.env.batched_env import BatchedJadVecEnv
+from jad.env.gym_env import BASE_EPISODE_LENGTH, TRUNCATION_PENALTIES, RewardFunc
+from jad.env.observations import get_observation_dim
+
+N_ENVS = 3
+
+
+class FakeBatchWrapper:
+    """
+    Returns (obs, rewards, terminated, masks, jads_killed) like JadBatchProcessWrapper.
+
+    Every observation is filled with (env_id + 1) * 1000 + steps since that env's
+    last reset, so resets and terminal observations can be told apart. Envs listed
+    in `terminate` terminate when they reach that many steps.
+    """
+
+    def __init__(self, config: JadConfig, n_envs: int, terminate: dict[int, int]):
+        self.obs_dim = get_observation_dim(config)
+        self.mask_len = sum(get_action_dims(config))
+        self.n_envs = n_envs
+        self.terminate = terminate
+        self.steps = np.zeros(n_envs, dtype=np.int64)
+        self.reset_calls: list[list[int]] = []
+
+    def _results(self, env_ids: list[int], terminated: np.ndarray):
+        ids = np.asarray(env_ids, dtype=np.int64)
+        obs = np.repeat(((ids + 1) * 1000 + self.steps[ids]).astype(np.float32)[:, None], self.obs_dim, axis=1)
+        rewards = np.ones(len(ids), dtype=np.float32)
+        masks = np.zeros((len(ids), self.mask_len), dtype=np.bool_)
+        masks[:, 0] = self.steps[ids] % 2 == 0
+        jads_killed = terminated.astype(np.uint8)
+        return obs, rewards, terminated, masks, jads_killed
+
+    def reset(self):
+        return self.reset_envs(list(range(self.n_envs)))
+
+    def reset_envs(self, env_ids: list[int]):
+        self.reset_calls.append(list(env_ids))
+        self.steps[env_ids] = 0
+        return self._results(env_ids, np.zeros(len(env_ids), dtype=np.bool_))
+
+    def step_async(self, actions: np.ndarray) -> None:
+        assert actions.shape[0] == self.n_envs
+        self.steps += 1
+
+    def step_wait(self):
+        terminated = np.array(
+            [self.terminate.get(i) == self.steps[i] for i in range(self.n_envs)], dtype=np.bool_
+        )
+        return self._results(list(range(self.n_envs)), terminated)
+
+    def close(self) -> None:
+        pass
+
+
+def make_env(terminate: dict[int, int], reward_func: str = "jad1") -> tuple[BatchedJadVecEnv, FakeBatchWrapper]:
+    config = JadConfig()
+    venv = BatchedJadVecEnv(config, n_envs=N_ENVS, reward_func=reward_func)
+    fake = FakeBatchWrapper(config, N_ENVS, terminate)
+    venv.env = fake
+    return venv, fake
+
+
+def step(venv: BatchedJadVecEnv):
+    return venv.step(np.zeros((N_ENVS, len(venv.action_space.nvec)), dtype=np.int64))
+
+
+def test_autoreset_on_termination():
+    venv, fake = make_env(terminate={1: 2})
+    venv.reset()
+
+    _, _, dones, infos = step(venv)
+    assert not dones.any()
+    assert all("terminal_observation" not in info for info in infos)
+
+    obs, rewards, dones, infos = step(venv)
+    np.testing.assert_array_equal(dones, [False, True, False])
+    assert fake.reset_calls[-1] == [1]
+
+    # The terminal observation is env 1 after 2 steps; the returned one is its reset
+    np.testing.assert_array_equal(infos[1]["terminal_observation"], 2002.0)
+    np.testing.assert_array_equal(obs[1], 2000.0)
+    np.testing.assert_array_equal(obs[0], 1002.0)
+    assert infos[1]["TimeLimit.truncated"] is False
+    assert infos[1]["outcome"] == "kill"
+    assert infos[1]["jads_killed"] == 1
+    assert rewards[1] == 1.0
+    assert venv.get_attr("episode_length") == [2, 0, 2]
+
+
+def test_truncation_penalty():
+    venv, fake = make_env(terminate={})
+    venv.reset()
+    max_length = BASE_EPISODE_LENGTH * venv.config.jad_count
+
+    for _ in range(max_length - 1):
+        _, _, dones, _ = step(venv)
+        assert not dones.any()
+
+    obs, rewards, dones, infos = step(venv)
+    assert dones.all()
+    np.testing.assert_allclose(rewards, 1.0 + TRUNCATION_PENALTIES[RewardFunc.JAD1])
+    for i, info in enumerate(infos):
+        assert info["TimeLimit.truncated"] is True
+        assert info["raw_reward"] == pytest.approx(rewards[i])
+        assert info["outcome"] == "death"
+        np.testing.assert_array_equal(info["terminal_observation"], (i + 1) * 1000 + max_length)
+    assert fake.reset_calls[-1] == [0, 1, 2]
+    np.testing.assert_array_equal(obs[:, 0], [1000.0, 2000.0, 3000.0])
+
+
+def test_env_method_reset_only_resets_indices():
+    venv, fake = make_env(terminate={})
+    venv.reset()
+    step(venv)
+
+    results = venv.env_method("reset", indices=[2])
+    assert fake.reset_calls[-1] == [2]
+    assert len(results) == 1
+    np.testing.assert_array_equal(results[0][0], 3000.0)
+    assert venv.get_attr("episode_length") == [1, 1, 0]
+
+    masks = venv.env_method("action_masks", indices=[0, 2])
+    assert [m[0][0] for m in masks] == [False, True]
+
+
+def test_unsupported_per_env_access_raises():
+    venv, _ = make_env(terminate={})
+    with pytest.raises(AttributeError):
+        venv.get_attr("episode_lengths")
+    with pytest.raises(AttributeError):
+        venv.set_attr("render_mode", None, indices=[0])
+    with pytest.raises(AttributeError):
+        venv.env_method("close", indices=[0])
+    assert venv.get_attr("render_mode", indices=[0, 1]) == [None, None]
@@ -0,0 +1,88 @@
+"""obs_to_array and the serving parser must encode observations identically."""
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from jad import HealerState, JadConfig, JadState, Observation
+from jad.env.observations import get_observation_dim, obs_to_array
+from serve_agent import AgentServer
+
+CONFIGS = [JadConfig(jad_count=j, healers_per_jad=h) for j in range(1, 7) for h in range(6)]
+
+
+def random_observation_dict(rng: np.random.Generator, config: JadConfig) -> dict:
+    """Observation fields as sent by the browser client (jads/healers as lists of dicts)."""
+    jad_count = config.jad_count
+    total_healers = jad_count * config.healers_per_jad
+    return {
+        "player_hp": int(rng.integers(0, 116)),
+        "player_prayer": int(rng.integers(0, 100)),
+        "player_ranged": int(rng.integers(1, 113)),
+        "player_defence": int(rng.integers(1, 119)),
+        "player_location_x": int(rng.integers(0, 27)),
+        "player_location_y": int(rng.integers(0, 27)),
+        "player_target": int(rng.integers(0, 1 + jad_count + total_healers)),
+        "active_prayer": int(rng.integers(0, 4)),
+        "rigour_active": bool(rng.integers(0, 2)),
+        "bastion_doses": int(rng.integers(0, 5)),
+        "sara_brew_doses": int(rng.integers(0, 5)),
+        "super_restore_doses": int(rng.integers(0, 5)),
+        "jads": [
+            {
+                "hp": int(rng.integers(0, 351)),
+                "attack": int(rng.integers(0, 4)),
+                "ticks_until_impact": int(rng.integers(0, 4)),
+                "x": int(rng.integers(0, 27)),
+                "y": int(rng.integers(0, 27)),
+                "alive": bool(rng.integers(0, 2)),
+            }
+            for _ in range(jad_count)
+        ],
+        "healers": [
+            {
+                "hp": int(rng.integers(0, 91)),
+                "x": int(rng.integers(0, 27)),
+                "y": int(rng.integers(0, 27)),
+                "target": int(rng.integers(0, 3)),
+            }
+            for _ in range(total_healers)
+        ],
+        "healers_spawned": bool(rng.integers(0, 2)),
+        "next_projectile_type": int(rng.integers(0, 4)),
+        "next_projectile_ticks": int(rng.integers(0, 4)),
+        "starting_bastion_doses": int(rng.integers(0, 5)),
+        "starting_sara_brew_doses": int(rng.integers(0, 5)),
+        "starting_super_restore_doses": int(rng.integers(0, 5)),
+    }
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda c: f"{c.jad_count}jad_{c.healers_per_jad}heal")
+def test_obs_to_array_matches_serve_parser(config: JadConfig):
+    rng = np.random.default_rng(config.jad_count * 10 + config.healers_per_jad)
+    server = SimpleNamespace(config=config)
+    obs_dim = get_observation_dim(config)
+
+    for _ in range(20):
+        obs_dict = random_observation_dict(rng, config)
+        fields = {k: v for k, v in obs_dict.items() if k not in ("jads", "healers")}
+        obs = Observation.from_entities(
+            [JadState(**jad) for jad in obs_dict["jads"]],
+            [HealerState(**healer) for healer in obs_dict["healers"]],
+            **fields,
+        )
+
+        expected = obs_to_array(obs, config)
+        parsed = AgentServer._parse_observation_to_array(
+            server, obs_dict, np.full(obs_dim, np.nan, dtype=np.float32)
+        )
+
+        assert expected.shape == (obs_dim,)
+        np.testing.assert_array_equal(parsed, expected)
+
+        # Encoding into a row of a preallocated batch overwrites that row only
+        batch = np.full((2, obs_dim), np.nan, dtype=np.float32)
+        row = batch[1]
+        assert obs_to_array(obs, config, out=row) is row
+        np.testing.assert_array_equal(row, expected)
+        assert np.isnan(batch[0]).all()
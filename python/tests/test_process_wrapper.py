@@ -0,0 +1,84 @@
+"""Reply frames built like src/headless/main.ts must parse back to the values that were packed."""
+import numpy as np
+import pytest
+
+from jad import JadConfig
+from jad.actions import get_action_dims
+from jad.env.observations import get_observation_dim
+from jad.env.process_wrapper import (
+    ERROR_TAG,
+    REPLY_HEADER,
+    RESULT_TAG,
+    EnvProcessWrapper,
+    JadBatchProcessWrapper,
+)
+
+# 6 Jads with 5 healers each: the flattened mask is longer than 32 bits
+CONFIGS = [JadConfig(jad_count=1, healers_per_jad=3), JadConfig(jad_count=6, healers_per_jad=5)]
+
+
+def build_reply(masks: np.ndarray, obs: np.ndarray, rewards, terminated, jads_killed) -> bytes:
+    """Pack a result reply for len(masks) envs in the layout written by outputResults."""
+    count, mask_len = masks.shape
+    bits = (masks.astype(np.uint64) << np.arange(mask_len, dtype=np.uint64)).sum(axis=1, dtype=np.uint64)
+    return b"".join((
+        REPLY_HEADER.pack(RESULT_TAG, mask_len, count, 0),
+        bits.astype("<u8").tobytes(),
+        np.asarray(obs, dtype="<f4").tobytes(),
+        np.asarray(rewards, dtype="<f4").tobytes(),
+        np.asarray(terminated, dtype=np.uint8).tobytes(),
+        np.asarray(jads_killed, dtype=np.uint8).tobytes(),
+    ))
+
+
+def random_batch(rng: np.random.Generator, config: JadConfig, count: int):
+    mask_len = sum(get_action_dims(config))
+    masks = rng.integers(0, 2, size=(count, mask_len)).astype(np.bool_)
+    masks[:, -1] = True  # Always exercise the highest bit
+    obs = rng.standard_normal((count, get_observation_dim(config))).astype(np.float32)
+    rewards = rng.standard_normal(count).astype(np.float32)
+    terminated = rng.integers(0, 2, size=count).astype(np.bool_)
+    jads_killed = rng.integers(0, config.jad_count + 1, size=count).astype(np.uint8)
+    return masks, obs, rewards, terminated, jads_killed
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda c: f"{c.jad_count}jad_{c.healers_per_jad}heal")
+def test_parse_result(config: JadConfig):
+    rng = np.random.default_rng(0)
+    wrapper = EnvProcessWrapper(config, reward_func="jad1")
+    masks, obs, rewards, terminated, jads_killed = random_batch(rng, config, 1)
+
+    result = wrapper._parse_result(build_reply(masks, obs, rewards, terminated, jads_killed))
+
+    np.testing.assert_array_equal(result.observation, obs[0])
+    assert result.reward == rewards[0]
+    assert result.terminated == terminated[0]
+    assert result.jads_killed == jads_killed[0]
+    np.testing.assert_array_equal(np.concatenate(result.valid_action_mask), masks[0])
+    assert tuple(len(m) for m in result.valid_action_mask) == tuple(get_action_dims(config))
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda c: f"{c.jad_count}jad_{c.healers_per_jad}heal")
+def test_parse_batch(config: JadConfig):
+    rng = np.random.default_rng(1)
+    wrapper = JadBatchProcessWrapper(config, n_envs=5, reward_func="jad1")
+    expected = random_batch(rng, config, 5)
+
+    parsed = wrapper._parse_batch(build_reply(*expected), 5)
+
+    for got, want in zip(parsed, (expected[1], expected[2], expected[3], expected[0], expected[4])):
+        np.testing.assert_array_equal(got, want)
+
+
+def test_error_reply_raises():
+    wrapper = EnvProcessWrapper(JadConfig(), reward_func="jad1")
+    with pytest.raises(RuntimeError, match="boom"):
+        wrapper._parse_result(ERROR_TAG + b"boom")
+
+
+def test_count_mismatch_raises():
+    config = JadConfig()
+    wrapper = JadBatchProcessWrapper(config, n_envs=2, reward_func="jad1")
+    reply = build_reply(*random_batch(np.random.default_rng(2), config, 3))
+    with pytest.raises(RuntimeError, match="Expected results for 2"):
+        wrapper._parse_batch(reply, 2)
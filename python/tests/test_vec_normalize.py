@@ -0,0 +1,66 @@
+"""RunningNormalizer must compute the same statistics with and without numba."""
+import numpy as np
+import pytest
+
+from jad.env import vec_normalize
+from jad.env.vec_normalize import RunningNormalizer
+
+BACKENDS = [
+    "numpy",
+    pytest.param(
+        "numba",
+        marks=pytest.mark.skipif(vec_normalize.njit is None, reason="numba is not installed"),
+    ),
+]
+
+
+@pytest.fixture(params=BACKENDS)
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        for name in ("_merge_scalar", "_merge_vector", "_normalize_batch"):
+            monkeypatch.setattr(vec_normalize, name, None)
+    return request.param
+
+
+def batches(rng: np.random.Generator, shape: tuple[int, ...], n_batches: int = 50) -> list[np.ndarray]:
+    # Large mean, small spread: the case where a one-pass sum of squares cancels badly
+    return [(1000.0 + 0.5 * rng.standard_normal(shape)).astype(np.float32) for _ in range(n_batches)]
+
+
+def test_update_matches_np_var(backend):
+    data = batches(np.random.default_rng(0), (16, 7))
+    normalizer = RunningNormalizer(shape=(7,))
+    for batch in data:
+        normalizer.update(batch)
+
+    stacked = np.concatenate(data).astype(np.float64)
+    assert normalizer.count == len(stacked)
+    np.testing.assert_allclose(normalizer.mean, stacked.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(normalizer.var, stacked.var(axis=0), rtol=1e-6)
+
+
+def test_update_scalar_batch_matches_np_var(backend):
+    data = [batch.astype(np.float64) for batch in batches(np.random.default_rng(1), (16,))]
+    normalizer = RunningNormalizer(shape=())
+    for batch in data:
+        normalizer.update_scalar_batch(batch)
+
+    stacked = np.concatenate(data)
+    assert normalizer.count == len(stacked)
+    np.testing.assert_allclose(normalizer.mean, stacked.mean(), rtol=1e-12)
+    np.testing.assert_allclose(normalizer.var, stacked.var(), rtol=1e-6)
+
+
+def test_normalize_matches_numpy(backend):
+    rng = np.random.default_rng(2)
+    normalizer = RunningNormalizer(shape=(7,))
+    for batch in batches(rng, (16, 7), n_batches=5):
+        normalizer.update(batch)
+
+    x = batches(rng, (16, 7), n_batches=1)[0]
+    expected = (x - normalizer.mean.astype(np.float32)) * normalizer.inv_std
+
+    np.testing.assert_array_equal(normalizer.normalize(x), expected)
+    out = np.empty_like(x)
+    assert normalizer.normalize(x, out=out) is out
+    np.testing.assert_array_equal(out, expected)
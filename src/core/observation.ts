@@ -200,3 +200,98 @@ export function buildObservation(
         starting_super_restore_doses: startingDoses.superRestore,
     };
 }
+
+// Normalization constants (must match python/jad/env/observations.py)
+const MAX_PLAYER_HP = 115;
+const MAX_PRAYER = 99;
+const MAX_MELEE_STAT = 118;
+const MAX_RANGED_STAT = 112;
+const MAX_COORD = 26;
+const MAX_JAD_HP = 350;
+const MAX_HEALER_HP = 90;
+const JAD_PROJECTILE_DELAY = 3;
+
+function safeDivide(value: number, divisor: number): number {
+    return divisor <= 0 ? 0 : value / divisor;
+}
+
+/**
+ * Length of the encoded observation vector (mirrors get_observation_dim in Python).
+ */
+export function getObservationDim(config: JadConfig): number {
+    const jadCount = config.jadCount;
+    const healerCount = jadCount * config.healersPerJad;
+
+    return 9 + 1                      // player continuous + next projectile ticks
+        + (1 + jadCount + healerCount) // player target one-hot
+        + 4 + 4                        // active prayer one-hot + next projectile type one-hot
+        + 4 * jadCount                 // jad continuous
+        + 4 * jadCount                 // jad attack one-hot
+        + 3 * healerCount              // healer continuous
+        + 3 * healerCount              // healer target one-hot
+        + 2;                           // binary
+}
+
+/**
+ * Encode an observation into the flat float vector consumed by the policy.
+ *
+ * Layout mirrors obs_to_array in python/jad/env/observations.py:
+ * continuous features first (player, next projectile, jads, healers),
+ * then one-hot features, then binary features.
+ */
+export function encodeObservation(obs: Observation, config: JadConfig, out: Float32Array): Float32Array {
+    const targetSize = 1 + config.jadCount + config.jadCount * config.healersPerJad;
+    out.fill(0);
+    let i = 0;
+
+    // ========== CONTINUOUS FEATURES ==========
+    out[i++] = obs.player_hp / MAX_PLAYER_HP;
+    out[i++] = obs.player_prayer / MAX_PRAYER;
+    out[i++] = obs.player_ranged / MAX_RANGED_STAT;
+    out[i++] = obs.player_defence / MAX_MELEE_STAT;
+    out[i++] = safeDivide(obs.bastion_doses, obs.starting_bastion_doses);
+    out[i++] = safeDivide(obs.sara_brew_doses, obs.starting_sara_brew_doses);
+    out[i++] = safeDivide(obs.super_restore_doses, obs.starting_super_restore_doses);
+    out[i++] = obs.player_location_x / MAX_COORD;
+    out[i++] = obs.player_location_y / MAX_COORD;
+
+    out[i++] = obs.next_projectile_ticks / JAD_PROJECTILE_DELAY;
+
+    for (const jad of obs.jads) {
+        out[i++] = jad.hp / MAX_JAD_HP;
+        out[i++] = jad.x / MAX_COORD;
+        out[i++] = jad.y / MAX_COORD;
+        out[i++] = jad.ticks_until_impact / JAD_PROJECTILE_DELAY;
+    }
+
+    for (const healer of obs.healers) {
+        out[i++] = healer.hp / MAX_HEALER_HP;
+        out[i++] = healer.x / MAX_COORD;
+        out[i++] = healer.y / MAX_COORD;
+    }
+
+    // ========== ONE-HOT FEATURES ==========
+    // Out-of-range indices leave the block all-zero, matching one_hot() in Python
+    const oneHot = (index: number, size: number): void => {
+        if (index >= 0 && index < size) {
+            out[i + index] = 1;
+        }
+        i += size;
+    };
+
+    oneHot(obs.player_target, targetSize);
+    oneHot(obs.active_prayer, 4);
+    oneHot(obs.next_projectile_type, 4);
+    for (const jad of obs.jads) {
+        oneHot(jad.attack, 4);
+    }
+    for (const healer of obs.healers) {
+        oneHot(healer.target, 3);
+    }
+
+    // ========== BINARY FEATURES ==========
+    out[i++] = obs.rigour_active ? 1 : 0;
+    out[i++] = obs.healers_spawned ? 1 : 0;
+
+    return out;
+}
@@ -6,7 +6,7 @@
  * Uses require() instead of import to control execution order.
  */
 
-// Redirect ALL console output to stderr to keep stdout clean for JSON protocol
+// Redirect ALL console output to stderr to keep stdout clean for the framed protocol
 // Must happen before ANY other code runs
 const _stderr = process.stderr;
 const writeToStderr = (...args: unknown[]) => {
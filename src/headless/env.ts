@@ -29,7 +29,9 @@ export class HeadlessEnv {
     // Track starting potion doses for observation normalization
     private startingDoses = { bastion: 0, saraBrew: 0, superRestore: 0 };
 
-    private prevObservation: Observation | null = null;
+    // Observation at the end of the last reset/step. Nothing changes the world between
+    // steps, so it is the next step's pre-action observation and need not be rebuilt
+    private lastObservation: Observation | null = null;
     private episodeLength: number = 0;
 
     constructor(
@@ -57,7 +59,7 @@ export class HeadlessEnv {
 
         this.captureStartingDoses();
 
-        this.prevObservation = null;
+        this.lastObservation = null;
         this.episodeLength = 0;
     }
 
@@ -83,6 +85,7 @@ export class HeadlessEnv {
             this.startingDoses
         );
         const validActionMask = buildValidActionMask(jadRegion, this.jadConfig, observation);
+        this.lastObservation = observation;
 
         return {
             observation,
@@ -95,7 +98,10 @@ export class HeadlessEnv {
     step(action: number[]): StepResult {
         const jadRegion = this.region as JadRegion;
 
-        this.prevObservation = buildObservation(
+        // Trainer holds a single global player; several envs can share this process
+        Trainer.setPlayer(this.player);
+
+        const prevObservation = this.lastObservation ?? buildObservation(
             this.player,
             jadRegion,
             this.jadConfig,
@@ -116,12 +122,13 @@ export class HeadlessEnv {
         const termination = checkTermination(this.player, jadRegion, this.jadConfig);
         const reward = computeReward(
             observation,
-            this.prevObservation,
+            prevObservation,
             termination,
             this.episodeLength,
             this.envConfig.rewardFunc
         );
         const validActionMask = buildValidActionMask(jadRegion, this.jadConfig, observation);
+        this.lastObservation = observation;
 
         return {
             observation,
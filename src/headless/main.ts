@@ -1,9 +1,8 @@
 // Must import mocks FIRST before any osrs-sdk imports
 import './mocks';
 
-import * as readline from 'readline';
 import { Settings } from 'osrs-sdk';
-import { JadRegion, JadConfig, StepResult } from '../core';
+import { JadRegion, JadConfig, StepResult, getObservationDim, getActionSpaceDims, encodeObservation } from '../core';
 import { HeadlessEnv, EnvConfig } from './env';
 
 // Initialize settings from (mock) storage
@@ -23,6 +22,14 @@ function parseJadConfig(): JadConfig {
     return { jadCount, healersPerJad };
 }
 
+function parseNumEnvs(): number {
+    const numEnvs = parseInt(process.env.NUM_ENVS || '1', 10);
+    if (!(numEnvs >= 1)) {
+        throw new Error(`NUM_ENVS must be >= 1, got ${process.env.NUM_ENVS}`);
+    }
+    return numEnvs;
+}
+
 function parseEnvConfig(): EnvConfig {
     const rewardFunc = process.env.REWARD_FUNC || 'jad1';
     return { rewardFunc };
@@ -30,58 +37,176 @@ function parseEnvConfig(): EnvConfig {
 
 const jadConfig = parseJadConfig();
 const envConfig = parseEnvConfig();
-const env = new HeadlessEnv((cfg: JadConfig) => new JadRegion(cfg), jadConfig, envConfig);
-
-// Set up stdio protocol
-const rl = readline.createInterface({
-    input: process.stdin,
-    output: process.stdout,
-    terminal: false,
-});
+const numEnvs = parseNumEnvs();
+
+// All envs live in this process; every command addresses the whole batch unless
+// it names specific env_ids, and replies hold one result body per addressed env
+const envs = Array.from(
+    { length: numEnvs },
+    () => new HeadlessEnv((cfg: JadConfig) => new JadRegion(cfg), jadConfig, envConfig)
+);
+
+// Every message on stdin/stdout is a 4-byte big-endian payload length followed by the payload
+const FRAME_HEADER_SIZE = 4;
+
+// Reply layout (little-endian), structure-of-arrays over the `count` envs a command addressed:
+//   [0]      tag: 'R' (results) or 'E' (error, followed by a UTF-8 message)
+//   [1]      valid action mask length per env: u8
+//   [2..3]   count: u16
+//   [4..7]   reserved
+//   [8..]    valid action masks: u64 * count, bit i = entry i of the heads flattened in order
+//   then     encoded observations: f32 * count * obsDim
+//   then     rewards: f32 * count
+//   then     terminated: u8 * count
+//   then     jads killed (hp <= 0): u8 * count
+const REPLY_HEADER_SIZE = 8;
+const MAX_MASK_BITS = 64;
+const RESULT_TAG = 0x52; // 'R'
+const ERROR_TAG = 0x45;  // 'E'
+
+// Step command body: 'S' followed by one little-endian int32 per action head, for every env in order.
+// Control commands are JSON objects: {command: 'reset', env_ids?: number[]} and {command: 'close'}.
+const STEP_TAG = 0x53; // 'S'
+
+const obsDim = getObservationDim(jadConfig);
+const numHeads = getActionSpaceDims(jadConfig).length;
 
 // Output function that writes directly to stdout (bypasses console.log redirect)
-function output(data: unknown): void {
-    process.stdout.write(JSON.stringify(data) + '\n');
+function writeFrame(body: Buffer): void {
+    const header = Buffer.allocUnsafe(FRAME_HEADER_SIZE);
+    header.writeUInt32BE(body.length, 0);
+    process.stdout.write(Buffer.concat([header, body]));
+}
+
+function outputResults(results: StepResult[]): void {
+    const count = results.length;
+    const masks = results.map((result) => result.valid_action_mask.flat());
+    const maskLength = masks.length > 0 ? masks[0].length : 0;
+    if (maskLength > MAX_MASK_BITS) {
+        throw new Error(`Action mask has ${maskLength} entries, bitfield holds ${MAX_MASK_BITS}`);
+    }
+
+    const maskOffset = REPLY_HEADER_SIZE;
+    const obsOffset = maskOffset + 8 * count;
+    const rewardOffset = obsOffset + 4 * count * obsDim;
+    const terminatedOffset = rewardOffset + 4 * count;
+    const jadsKilledOffset = terminatedOffset + count;
+
+    // Buffer.alloc is never pooled, so byteOffset is 0 and the f32 views below are aligned
+    const body = Buffer.alloc(jadsKilledOffset + count);
+    body.writeUInt8(RESULT_TAG, 0);
+    body.writeUInt8(maskLength, 1);
+    body.writeUInt16LE(count, 2);
+
+    const observations = new Float32Array(body.buffer, body.byteOffset + obsOffset, count * obsDim);
+    const rewards = new Float32Array(body.buffer, body.byteOffset + rewardOffset, count);
+
+    for (let e = 0; e < count; e++) {
+        const result = results[e];
+
+        // Pack the mask into two u32 words (avoids BigInt for the u64 field)
+        const mask = masks[e];
+        let maskLo = 0;
+        let maskHi = 0;
+        for (let i = 0; i < mask.length; i++) {
+            if (!mask[i]) continue;
+            if (i < 32) {
+                maskLo = (maskLo | (1 << i)) >>> 0;
+            } else {
+                maskHi = (maskHi | (1 << (i - 32))) >>> 0;
+            }
+        }
+        body.writeUInt32LE(maskLo, maskOffset + 8 * e);
+        body.writeUInt32LE(maskHi, maskOffset + 8 * e + 4);
+
+        encodeObservation(result.observation, jadConfig, observations.subarray(e * obsDim, (e + 1) * obsDim));
+        rewards[e] = result.reward;
+        body[terminatedOffset + e] = result.terminated ? 1 : 0;
+        body[jadsKilledOffset + e] = result.observation.jads.filter((jad) => jad.hp <= 0).length;
+    }
+
+    writeFrame(body);
+}
+
+function outputError(message: string): void {
+    writeFrame(Buffer.concat([Buffer.from([ERROR_TAG]), Buffer.from(message)]));
 }
 
-rl.on('line', (line: string) => {
+function decodeStepActions(payload: Buffer): number[][] {
+    const view = new DataView(payload.buffer, payload.byteOffset + 1, payload.length - 1);
+    const expectedBytes = 4 * numEnvs * numHeads;
+    if (view.byteLength !== expectedBytes) {
+        throw new Error(
+            `Step payload has ${view.byteLength} bytes, expected ${expectedBytes} (${numEnvs} envs x ${numHeads} int32 actions)`
+        );
+    }
+
+    const actions: number[][] = [];
+    for (let e = 0; e < numEnvs; e++) {
+        const action = new Array<number>(numHeads);
+        for (let h = 0; h < numHeads; h++) {
+            action[h] = view.getInt32((e * numHeads + h) * 4, true);
+        }
+        actions.push(action);
+    }
+    return actions;
+}
+
+function handleMessage(payload: Buffer): void {
     try {
-        const msg = JSON.parse(line);
-        let result: StepResult;
+        if (payload[0] === STEP_TAG) {
+            const actions = decodeStepActions(payload);
+            outputResults(envs.map((env, i) => env.step(actions[i])));
+            return;
+        }
+
+        const msg = JSON.parse(payload.toString());
 
         switch (msg.command) {
-            case 'reset':
-                result = env.reset();
+            case 'reset': {
+                const envIds: number[] = msg.env_ids ?? envs.map((_, i) => i);
+                outputResults(envIds.map((i) => envs[i].reset()));
                 break;
+            }
 
             case 'step':
-                result = env.step(msg.action);
+                outputResults([envs[msg.env_id ?? 0].step(msg.action)]);
                 break;
 
             case 'close':
-                rl.close();
                 process.exit(0);
                 break;
 
             default:
-                output({ error: `Unknown command: ${msg.command}` });
-                return;
+                outputError(`Unknown command: ${msg.command}`);
         }
-
-        output(result);
     } catch (err) {
         const errorMessage = err instanceof Error ? err.message : String(err);
-        output({ error: errorMessage });
+        outputError(errorMessage);
+    }
+}
+
+// Reassemble frames from stdin chunks (a chunk may hold a partial frame or several frames)
+let pending: Buffer = Buffer.alloc(0);
+
+process.stdin.on('data', (chunk: Buffer) => {
+    pending = pending.length === 0 ? chunk : Buffer.concat([pending, chunk]);
+
+    while (pending.length >= FRAME_HEADER_SIZE) {
+        const frameEnd = FRAME_HEADER_SIZE + pending.readUInt32BE(0);
+        if (pending.length < frameEnd) {
+            break;
+        }
+        handleMessage(pending.subarray(FRAME_HEADER_SIZE, frameEnd));
+        pending = pending.subarray(frameEnd);
     }
 });
 
 // Handle clean shutdown
 process.on('SIGINT', () => {
-    rl.close();
     process.exit(0);
 });
 
 process.on('SIGTERM', () => {
-    rl.close();
     process.exit(0);
 });